@@ -1,34 +1,119 @@
 import pandas as pd
-import re
-from flask import Flask, jsonify
-import requests
-from io import BytesIO
+from flask import Flask, jsonify, request
+import logging
 import os
 from dotenv import load_dotenv
 import tempfile
-from collections import defaultdict
+import threading
+import time
+from concurrent.futures import Future
+from graph_client import GraphClient, select_drive
+from scoring import compute_results_parallel, compile_puntajes, build_excel
+from encuesta import load_encuesta
+from reportes import REPORTES_FOLDER, UPLOAD_CONCURRENCY, publish_company_reports
+from validacion import ValidationError, raise_if_invalid, validate_puntajes, validate_encuesta_headers, validate_coverage
+from consultas import consultas_bp, publish_results, configure_history, sync_from_history, get_results_index
+from historial import ResultsStore, file_sha256
+from watcher import DeltaWatcher
+from registro import configure_logging, correlation_context, current_correlation_id
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: un solo proceso (waitress), basta con el bloqueo entre hilos
+    fcntl = None
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 app = Flask(__name__)
+app.register_blueprint(consultas_bp)
+
+# Cliente HTTP compartido para Microsoft Graph (timeouts, reintentos y circuit breaker)
+graph = GraphClient.from_env()
+
+# Histórico local de ejecuciones (SQLite)
+HISTORIAL_ENABLED = os.getenv("HISTORIAL_ENABLED", "true").lower() == "true"
+HISTORIAL_DB = os.getenv("HISTORIAL_DB", os.path.join(os.getcwd(), "historial", "resultados.sqlite"))
+historial = ResultsStore(HISTORIAL_DB) if HISTORIAL_ENABLED else None
+configure_history(historial)
+
+# Archivos de entrada en SharePoint y archivo generado
+SITE_URL = "marketingconsultia.sharepoint.com:/sites/BIDCiberseguridad"
+SHAREPOINT_FILES = {
+    'encuesta': 'Documentos compartidos/Encuesta sobre brechas digitales en ciberseguridad en PYMEs.xlsx',
+    'puntajes': 'Documentos compartidos/puntajes.xlsx'
+}
+OUTPUT_FILENAME = "tabla_radar.xlsx"
+
+# Modo watcher: regenerar automáticamente cuando cambian los archivos de entrada
+WATCH_ENABLED = os.getenv("WATCH_ENABLED", "false").lower() == "true"
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "60"))
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", "120"))
+
+# Procesos para puntuar exportaciones grandes (1 = en el propio hilo de la petición).
+# Las generaciones van de una en una también entre workers de gunicorn, así que no se multiplican
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", "1"))
+
+# Reportes individuales por empresa: '' (desactivado), 'xlsx' o 'csv'
+REPORTES_EMPRESA = os.getenv("REPORTES_EMPRESA", "").lower()
+REPORTES_EMPRESA_FOLDER = os.getenv("REPORTES_EMPRESA_FOLDER", REPORTES_FOLDER)
+REPORTES_UPLOAD_CONCURRENCY = int(os.getenv("REPORTES_UPLOAD_CONCURRENCY", str(UPLOAD_CONCURRENCY)))
+# Procesos para generar los archivos por empresa (0 = todos los núcleos). Las generaciones
+# van de una en una también entre workers de gunicorn, así que no se multiplican
+REPORTES_WORKERS = int(os.getenv("REPORTES_WORKERS", "0"))
 
 # Variable de entorno para modo debug
 DEBUG_MODE = os.getenv("DEBUG_MODE", "false").lower() == "true"
 
+# Nivel y formato de los registros (LOG_LEVEL, LOG_FORMAT=json); DEBUG_MODE activa el nivel DEBUG
+configure_logging(level=os.getenv("LOG_LEVEL") or ("DEBUG" if DEBUG_MODE else "INFO"))
+
 # Crear directorio debug_files si el modo debug está activado
 if DEBUG_MODE:
     debug_dir = os.path.join(os.getcwd(), "debug_files")
     if not os.path.exists(debug_dir):
         os.makedirs(debug_dir)
-    print(f"Modo DEBUG activado. Archivos se guardarán en: {debug_dir}")
+    logger.info("Modo DEBUG activado. Archivos se guardarán en: %s", debug_dir)
+
+# Token de Graph reutilizado hasta poco antes de que caduque
+_token_cache = {'access_token': None, 'expires_at': 0}
+_token_lock = threading.Lock()
+TOKEN_MARGIN = 300
+
+# Contenido de las entradas ya descargadas, por ruta y eTag
+_input_cache = {}
+# eTags de las entradas de la última generación correcta
+_last_generation = {'etags': None}
+# Tabla de puntajes compilada, válida mientras no cambie el eTag de puntajes.xlsx
+_scoring_cache = {'entrada': (None, None)}
+# Estado del precalentamiento de este proceso (cada worker tiene el suyo)
+_warm_state = {'warm': False, 'duracion': None, 'error': None}
+# Generación en curso en este proceso: (parámetros, Future con su resultado)
+_generation = {'en_curso': None}
+_generation_lock = threading.Lock()
+# Con varios workers de gunicorn las generaciones de distintos procesos van de una en una
+GENERATION_LOCK_FILE = os.getenv("GENERATION_LOCK_FILE",
+                                 os.path.join(tempfile.gettempdir(), "sharepoint-generation.lock"))
+watcher = None
 
 def get_access_token():
+    """Obtener token de acceso (en caché hasta ``TOKEN_MARGIN`` segundos antes de caducar)"""
+    with _token_lock:
+        if _token_cache['access_token'] and time.monotonic() < _token_cache['expires_at']:
+            return _token_cache['access_token']
+        token = _request_access_token()
+        _token_cache['access_token'] = token['access_token']
+        _token_cache['expires_at'] = time.monotonic() + int(token.get('expires_in', 3599)) - TOKEN_MARGIN
+        return _token_cache['access_token']
+
+def _request_access_token():
     """Obtener token de acceso usando Client Credentials Flow para Microsoft Graph"""
     tenant_id = os.getenv("TENANT_ID")
     client_id = os.getenv("CLIENT_ID")
     client_secret = os.getenv("CLIENT_SECRET")
     
     # URL para obtener el token
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+    token_url = graph.token_url(tenant_id)
     
     # Datos para la solicitud
     token_data = {
@@ -39,54 +124,57 @@ def get_access_token():
     }
     
     # Solicitar el token
-    response = requests.post(token_url, data=token_data)
+    response = graph.post(token_url, data=token_data)
     response.raise_for_status()
     
-    return response.json()['access_token']
+    return response.json()
 
-def download_sharepoint_file(access_token, site_id, file_path, temp_dir):
-    """Descargar archivo desde SharePoint usando Microsoft Graph API"""
+def get_drive_id(access_token, site_id):
+    """Obtener el ID del drive principal del sitio (una petición a /drives)"""
+    drives_url = f"{graph.graph_url}/sites/{site_id}/drives"
+    
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Accept': 'application/json'
+    }
+    
+    # Obtener información de los drives
+    drives_response = graph.get(drives_url, headers=headers)
+    drives_response.raise_for_status()
+    
+    # Buscar el drive principal (Documents)
+    return select_drive(drives_response.json())
+
+def download_sharepoint_file(access_token, site_id, file_path, temp_dir, drive_id=None, item=None):
+    """Descargar archivo desde SharePoint usando Microsoft Graph API
+
+    Si se pasan ``drive_id`` e ``item`` (resueltos con ``graph.resolve_site``)
+    no se hace ninguna petición de metadatos antes de la descarga.
+    """
     try:
-        # Construir la URL correcta para Microsoft Graph
-        # Usar /sites/{site-id}/drives/{drive-id}/root:/{item-path}:/content
-        # Primero necesitamos obtener el drive ID del sitio
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Accept': 'application/json'
         }
         
-        # Obtener información de los drives
-        drives_response = requests.get(drives_url, headers=headers)
-        drives_response.raise_for_status()
-        drives_data = drives_response.json()
-        
-        # Buscar el drive principal (Documents)
-        drive_id = None
-        for drive in drives_data.get('value', []):
-            if drive.get('name') == 'Documents' or 'document' in drive.get('name', '').lower():
-                drive_id = drive['id']
-                break
-        
-        if not drive_id and drives_data.get('value'):
-            # Si no encontramos el drive de Documents, usar el primero disponible
-            drive_id = drives_data['value'][0]['id']
-        
-        if not drive_id:
-            raise Exception("No se pudo encontrar un drive válido en el sitio de SharePoint")
-        
-        print(f"Debug - Drive ID: {drive_id}")
-        
-        # Construir la URL del archivo
-        # Remover "Documentos compartidos/" del path ya que es parte del drive
-        clean_file_path = file_path.replace('Documentos compartidos/', '')
-        file_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{clean_file_path}:/content"
-        
-        print(f"Debug - File URL: {file_url}")
-        
-        # Descargar el archivo
-        file_response = requests.get(file_url, headers=headers)
+        if item and item.get('@microsoft.graph.downloadUrl'):
+            # URL de descarga pre-autenticada: evita la redirección de /content
+            file_url = item['@microsoft.graph.downloadUrl']
+            file_response = graph.get(file_url)
+        else:
+            if not drive_id:
+                drive_id = get_drive_id(access_token, site_id)
+                logger.debug("Drive ID: %s", drive_id)
+            
+            # Construir la URL del archivo
+            # Remover "Documentos compartidos/" del path ya que es parte del drive
+            clean_file_path = file_path.replace('Documentos compartidos/', '')
+            file_url = f"{graph.graph_url}/sites/{site_id}/drives/{drive_id}/root:/{clean_file_path}:/content"
+            
+            logger.debug("File URL: %s", file_url)
+            
+            # Descargar el archivo
+            file_response = graph.get(file_url, headers=headers)
         file_response.raise_for_status()
         
         # Guardar el archivo en el directorio temporal
@@ -96,7 +184,7 @@ def download_sharepoint_file(access_token, site_id, file_path, temp_dir):
         with open(local_path, 'wb') as f:
             f.write(file_response.content)
         
-        print(f"Debug - Archivo descargado: {local_path}")
+        logger.debug("Archivo descargado: %s", local_path)
         
         # Si el modo debug está activado, guardar también una copia en debug_files
         if DEBUG_MODE:
@@ -104,295 +192,325 @@ def download_sharepoint_file(access_token, site_id, file_path, temp_dir):
             debug_path = os.path.join(debug_dir, filename)
             with open(debug_path, 'wb') as f:
                 f.write(file_response.content)
-            print(f"Debug - Copia guardada en modo debug: {debug_path}")
+            logger.debug("Copia guardada en modo debug: %s", debug_path)
         
         return local_path
         
     except Exception as e:
-        print(f"Error downloading file from {file_path}: {str(e)}")
+        logger.error("Error downloading file from %s: %s", file_path, e)
         raise
 
-def upload_sharepoint_file(access_token, site_id, file_content, filename, folder_path=""):
+def upload_sharepoint_file(access_token, site_id, file_content, filename, folder_path="", drive_id=None,
+                           content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'):
     """Subir archivo a SharePoint usando Microsoft Graph API"""
     try:
-        # Obtener el drive ID del sitio
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
-        
-        # Obtener información de los drives
-        drives_response = requests.get(drives_url, headers=headers)
-        drives_response.raise_for_status()
-        drives_data = drives_response.json()
-        
-        # Buscar el drive principal (Documents)
-        drive_id = None
-        for drive in drives_data.get('value', []):
-            if drive.get('name') == 'Documents' or 'document' in drive.get('name', '').lower():
-                drive_id = drive['id']
-                break
-        
-        if not drive_id and drives_data.get('value'):
-            # Si no encontramos el drive de Documents, usar el primero disponible
-            drive_id = drives_data['value'][0]['id']
-        
+        # Obtener el drive ID del sitio si no viene ya resuelto
         if not drive_id:
-            raise Exception("No se pudo encontrar un drive válido en el sitio de SharePoint")
-        
-        print(f"Debug - Upload Drive ID: {drive_id}")
+            drive_id = get_drive_id(access_token, site_id)
+            logger.debug("Upload Drive ID: %s", drive_id)
         
         # Construir la URL para subir el archivo
         # Si hay folder_path, incluirlo en la ruta
         if folder_path:
-            upload_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{folder_path}/{filename}:/content"
+            upload_url = f"{graph.graph_url}/sites/{site_id}/drives/{drive_id}/root:/{folder_path}/{filename}:/content"
         else:
-            upload_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{filename}:/content"
+            upload_url = f"{graph.graph_url}/sites/{site_id}/drives/{drive_id}/root:/{filename}:/content"
         
-        print(f"Debug - Upload URL: {upload_url}")
+        logger.debug("Upload URL: %s", upload_url)
         
         # Headers para la subida
         upload_headers = {
             'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            'Content-Type': content_type
         }
         
         # Subir el archivo
-        upload_response = requests.put(upload_url, headers=upload_headers, data=file_content)
+        upload_response = graph.put(upload_url, headers=upload_headers, data=file_content)
         upload_response.raise_for_status()
         
-        print(f"Debug - Archivo subido exitosamente: {filename}")
+        logger.debug("Archivo subido exitosamente: %s", filename)
         return upload_response.json()
         
     except Exception as e:
-        print(f"Error uploading file {filename}: {str(e)}")
+        logger.error("Error uploading file %s: %s", filename, e)
         raise
 
-def process_empresa_data(df_encuesta):
-    """Process company data efficiently using vectorized operations"""
-    empresas = {}
-    
-    for _, row in df_encuesta.iterrows():
-        id_empresa = row['ID']
-        if id_empresa not in empresas:
-            empresas[id_empresa] = {'Empresa': '', 'Pais': '', 'tamano_empresa': 'Desconocido'}
-            
-        for columna, valor in row.items():
-            if isinstance(columna, str) and isinstance(valor, str):
-                # Buscar código de pregunta para empresa
-                if 'Pg001' in columna:
-                    empresas[id_empresa]['Empresa'] = valor
-                # Buscar códigos de respuesta para país
-                if '[Pg011.01]' in valor:
-                    empresas[id_empresa]['Pais'] = 'Costa Rica'
-                elif '[Pg011.02]' in valor:
-                    empresas[id_empresa]['Pais'] = 'Panamá'
-                
-                # Procesar tamaño de empresa
-                if empresas[id_empresa]['Pais'] == 'Panamá':
-                    if '[Pa012.01]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Micro'
-                    elif '[Pa012.02]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
-                    elif '[Pa012.03]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Mediana'
-                    elif '[Pa012.04]' in valor or '[Pa012.05]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Grande'
-                elif empresas[id_empresa]['Pais'] == 'Costa Rica':
-                    if '[Pc012.01]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Micro'
-                    elif '[Pc012.02]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
-                    elif '[Pc012.03]' in valor or '[Pc012.04]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Mediana'
-                    elif '[Pc012.05]' in valor or '[Pc012.06]' in valor:
-                        empresas[id_empresa]['tamano_empresa'] = 'Grande'
-            
-    return empresas
+def fetch_input(access_token, sitio, ruta, temp_dir):
+    """Descargar una entrada salvo que su eTag coincida con la copia en memoria"""
+    item = sitio['items'].get(ruta)
+    if item is None:
+        raise FileNotFoundError(f"No se encontró el archivo '{ruta}' en SharePoint")
+    logger.debug("%s: eTag %s, %s bytes", item.get('name'), item.get('eTag'), item.get('size'),
+                 extra={'archivo': item.get('name'), 'etag': item.get('eTag'), 'bytes': item.get('size')})
 
-@app.route('/generate-excel', methods=['GET'])
-def generate_excel():
+    cached = _input_cache.get(ruta)
+    if cached and item.get('eTag') and cached['eTag'] == item['eTag']:
+        local_path = os.path.join(temp_dir, os.path.basename(ruta))
+        with open(local_path, 'wb') as f:
+            f.write(cached['content'])
+        logger.debug("%s sin cambios; se reutiliza la copia descargada", item.get('name'))
+        return local_path
+
+    local_path = download_sharepoint_file(access_token, sitio['site_id'], ruta, temp_dir,
+                                          drive_id=sitio['drive_id'], item=item)
+    with open(local_path, 'rb') as f:
+        _input_cache[ruta] = {'eTag': item.get('eTag'), 'content': f.read()}
+    return local_path
+
+def get_tabla_puntajes(etag, df_puntajes):
+    """Tabla de puntajes compilada; solo se recompila si cambió puntajes.xlsx"""
+    etag_compilado, tabla = _scoring_cache['entrada']
+    if etag and etag_compilado == etag:
+        return tabla
+    tabla = compile_puntajes(df_puntajes)
+    _scoring_cache['entrada'] = (etag, tabla)
+    return tabla
+
+def generate_report(origen='flask', solo_si_cambia=False, por_empresa=REPORTES_EMPRESA):
+    """Descargar entradas, puntuar, publicar y subir tabla_radar.xlsx.
+
+    Con ``solo_si_cambia`` (watcher) no se hace nada si los eTag de ambas
+    entradas coinciden con los de la última generación correcta. Con
+    ``por_empresa`` ('xlsx' o 'csv') se suben además los reportes por empresa.
+
+    Si ya hay una generación con los mismos parámetros en este proceso, se
+    espera a que termine y se devuelve su resultado (o su error); con otros
+    parámetros se espera y después se genera. Entre procesos se generan de
+    una en una (ver ``GENERATION_LOCK_FILE``).
+
+    Todos los registros de la generación llevan el mismo ``correlation_id``
+    (el de la petición si ya hay uno), que se devuelve en el resultado.
+    """
+    clave = (solo_si_cambia, por_empresa)
+    while True:
+        with _generation_lock:
+            en_curso = _generation['en_curso']
+            if en_curso is None:
+                futuro = Future()
+                _generation['en_curso'] = (clave, futuro)
+                break
+        clave_en_curso, futuro_en_curso = en_curso
+        if clave_en_curso == clave:
+            logger.info("Generación en curso con los mismos parámetros; se espera su resultado")
+            return dict(futuro_en_curso.result(), compartido=True)
+        # Esperar a que termine (sin propagar su error) y volver a intentarlo
+        futuro_en_curso.exception()
+
+    try:
+        with correlation_context(current_correlation_id()) as correlation_id:
+            logger.info("Generación iniciada (origen: %s)", origen, extra={'origen': origen})
+            inicio = time.perf_counter()
+            resultado = _generate_report(origen, solo_si_cambia, por_empresa)
+            resultado['correlation_id'] = correlation_id
+            logger.info("Generación terminada en %.1fs", time.perf_counter() - inicio,
+                        extra={'origen': origen, 'regenerado': resultado.get('regenerado')})
+        futuro.set_result(resultado)
+        return resultado
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _generation_lock:
+            _generation['en_curso'] = None
+
+
+def _lock_generation_file():
+    """Bloqueo exclusivo (con espera) de GENERATION_LOCK_FILE; el sistema lo libera si el proceso muere"""
+    if fcntl is None:
+        return None
+    lock = open(GENERATION_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+    except BaseException:
+        lock.close()
+        raise
+    return lock
+
+
+def _generate_report(origen, solo_si_cambia, por_empresa):
+    lock = _lock_generation_file()
     try:
         with tempfile.TemporaryDirectory() as temp_dir:
-            # URLs de los archivos en SharePoint
-            sharepoint_files = {
-                'encuesta': 'Documentos compartidos/Encuesta sobre brechas digitales en ciberseguridad en PYMEs.xlsx',
-                'puntajes': 'Documentos compartidos/puntajes.xlsx'
-            }
-            
             # Obtener token de acceso para Microsoft Graph
             access_token = get_access_token()
             
-            # Site ID de SharePoint (necesitamos obtenerlo primero)
-            site_url = "marketingconsultia.sharepoint.com:/sites/BIDCiberseguridad"
-            site_info_url = f"https://graph.microsoft.com/v1.0/sites/{site_url}"
+            # Resolver sitio, drive y metadatos de ambos archivos en un solo $batch
+            sitio = graph.resolve_site(access_token, SITE_URL, list(SHAREPOINT_FILES.values()))
+            site_id = sitio['site_id']
+            drive_id = sitio['drive_id']
+
+            etags = {ruta: (sitio['items'].get(ruta) or {}).get('eTag') for ruta in SHAREPOINT_FILES.values()}
+            if solo_si_cambia and all(etags.values()) and etags == _last_generation['etags']:
+                logger.info("Entradas sin cambios desde la última generación; no se regenera")
+                return {"message": "Sin cambios en los archivos de entrada", "regenerado": False}
             
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/json'
-            }
+            # Puntajes primero: es pequeño y sin él no tiene sentido descargar la encuesta
+            puntajes_path = fetch_input(access_token, sitio, SHAREPOINT_FILES['puntajes'], temp_dir)
+            df_puntajes = pd.read_excel(puntajes_path)
+            advertencias = raise_if_invalid(validate_puntajes(df_puntajes))['advertencias']
             
-            # Obtener información del sitio para conseguir el site_id
-            site_response = requests.get(site_info_url, headers=headers)
-            site_response.raise_for_status()
-            site_id = site_response.json()['id']
+            # Encuesta: validar los encabezados antes de leer la hoja completa
+            encuesta_path = fetch_input(access_token, sitio, SHAREPOINT_FILES['encuesta'], temp_dir)
+            advertencias += raise_if_invalid(validate_encuesta_headers(encuesta_path, df_puntajes))['advertencias']
+            df_encuesta = load_encuesta(encuesta_path, df_puntajes)
+            if logger.isEnabledFor(logging.DEBUG):
+                # memory_usage(deep=True) recorre todas las celdas: solo si se va a registrar
+                logger.debug("Encuesta: %d filas, %d columnas útiles, %.1f MB", len(df_encuesta),
+                             df_encuesta.shape[1], df_encuesta.memory_usage(deep=True).sum() / 1e6)
+            cobertura = raise_if_invalid(validate_coverage(df_encuesta, df_puntajes))
+            advertencias += cobertura['advertencias']
             
-            print(f"Debug - Site ID: {site_id}")
+            # Calcular las tablas de resultados
+            tabla_puntajes = get_tabla_puntajes(etags[SHAREPOINT_FILES['puntajes']], df_puntajes)
+            tablas = compute_results_parallel(df_encuesta, df_puntajes, workers=SCORING_WORKERS,
+                                              tabla_puntajes=tabla_puntajes)
+            empresas = tablas['empresas']
+            df_resultados_agrupados = tablas['resultados']
+
+            # Guardar la instantánea de la ejecución en el histórico
+            run_id = None
+            if historial:
+                run_id = historial.save_run(
+                    tablas,
+                    encuesta_hash=file_sha256(encuesta_path),
+                    puntajes_hash=file_sha256(puntajes_path),
+                    origen=origen
+                )
+                logger.info("Ejecución guardada en el histórico: run_id %s", run_id, extra={'run_id': run_id})
+
+            # Precalcular índices y agregados para la API de consultas
+            publish_results(tablas, run_id=run_id)
+
+            # Crear el archivo Excel final
+            file_content = build_excel(tablas)
+            
+            # Si el modo debug está activado, guardar tabla_radar.xlsx localmente
+            if DEBUG_MODE:
+                debug_dir = os.path.join(os.getcwd(), "debug_files")
+                debug_excel_path = os.path.join(debug_dir, OUTPUT_FILENAME)
+                with open(debug_excel_path, 'wb') as f:
+                    f.write(file_content)
+                logger.debug("%s guardado localmente en: %s", OUTPUT_FILENAME, debug_excel_path)
+            
+            # Subir archivo a SharePoint usando Microsoft Graph
+            upload_result = upload_sharepoint_file(
+                access_token, 
+                site_id, 
+                file_content, 
+                OUTPUT_FILENAME,
+                drive_id=drive_id
+            )
             
-            try:
-                # Descargar archivos desde SharePoint usando Microsoft Graph
-                encuesta_path = download_sharepoint_file(access_token, site_id, sharepoint_files['encuesta'], temp_dir)
-                puntajes_path = download_sharepoint_file(access_token, site_id, sharepoint_files['puntajes'], temp_dir)
-                
-                # Leer los archivos Excel
-                df_encuesta = pd.read_excel(encuesta_path, sheet_name="Form1")
-                df_puntajes = pd.read_excel(puntajes_path)
-                
-                print(f"Debug - Columnas de encuesta: {list(df_encuesta.columns)}")
-                print(f"Debug - Columnas de puntajes: {list(df_puntajes.columns)}")
-                print(f"Debug - Primeras filas de encuesta:")
-                print(df_encuesta.head())
-                
-                # Verificar si existe la columna ID, si no, usar la primera columna como ID
-                if 'ID' not in df_encuesta.columns:
-                    # Usar la primera columna como ID
-                    primera_columna = df_encuesta.columns[0]
-                    df_encuesta = df_encuesta.rename(columns={primera_columna: 'ID'})
-                    print(f"Debug - Renombrada columna '{primera_columna}' a 'ID'")
-                
-                # Procesar los datos
-                empresas = process_empresa_data(df_encuesta)
-                
-                # Calcular secciones_puntaje usando groupby
-                secciones_puntaje = df_puntajes.groupby('Seccion')['Puntaje'].sum().to_dict()
-                
-                # Calcula puntaje por tamaño suma si la fila tiene valor en la columna Pregunta Pequeña o Pregunta Mediana.
-                secciones_puntaje_pequena = defaultdict(int)
-                secciones_puntaje_mediana = defaultdict(int)
-
-                for _, row in df_puntajes.iterrows():
-                    if row['Respuesta Pequeña'] and not pd.isna(row['Respuesta Pequeña']):
-                        secciones_puntaje_pequena[row['Seccion']] += row['Puntaje']
-                    if row['Respuesta Mediana'] and not pd.isna(row['Respuesta Mediana']):
-                        secciones_puntaje_mediana[row['Seccion']] += row['Puntaje']
-                
-                # Preparar resultados
-                resultados = []
-                
-                # Procesar cada respuesta de la encuesta
-                for _, row_encuesta in df_encuesta.iterrows():
-                    id_empresa = row_encuesta['ID']
-                    empresa_info = empresas.get(id_empresa, {})
-                    if not empresa_info.get('Empresa'):
-                        continue
-                    
-                    # Procesar cada respuesta de la fila
-                    for columna, respuesta in row_encuesta.items():
-                        if not isinstance(respuesta, str):
-                            continue
-                            
-                        respuesta_match = re.search(r"\[([A-Za-z0-9_.]+)\]", str(respuesta))
-                        if not respuesta_match:
-                            continue
-                            
-                        respuesta_code = respuesta_match.group(1)
-                        
-                        # Buscar en df_puntajes
-                        puntaje_match = df_puntajes[
-                            (df_puntajes['Respuesta Pequeña'] == respuesta_code) |
-                            (df_puntajes['Respuesta Mediana'] == respuesta_code)
-                        ]
-                        
-                        if not puntaje_match.empty:
-                            tamano = 'Pequeña' if respuesta_code == puntaje_match['Respuesta Pequeña'].iloc[0] else 'Mediana'
-                            seccion = puntaje_match['Seccion'].iloc[0]
-                            
-                            resultados.append({
-                                'ID': id_empresa,
-                                'Empresa': empresa_info.get('Empresa', ''),
-                                'Tamaño': tamano,
-                                'Tamaño de empresa': empresa_info.get('tamano_empresa', 'Desconocido'),
-                                'Pais': empresa_info.get('Pais', ''),
-                                'Puntaje': float(puntaje_match['Puntaje'].iloc[0]),
-                                'Seccion': seccion,
-                                'Puntaje Seccion': secciones_puntaje_pequena[seccion] if tamano == 'Pequeña' else secciones_puntaje_mediana[seccion]
-                            })
-                
-                # Crear DataFrame y agrupar resultados
-                if not resultados:
-                    raise ValueError("No se encontraron resultados para procesar")
-                    
-                df_resultados = pd.DataFrame(resultados)
-                
-                # Agrupar resultados por las columnas necesarias y sumar puntajes
-                df_resultados_agrupados = df_resultados.groupby(
-                    ['ID', 'Empresa', 'Tamaño', 'Pais', 'Seccion', 'Tamaño de empresa'],
-                    as_index=False
-                ).agg({
-                    'Puntaje': 'sum',
-                    'Puntaje Seccion': 'first'  # Tomamos el primer valor ya que es el mismo para cada sección
-                })
-
-                # Calcular puntaje total por empresa
-                df_puntaje_total = df_resultados_agrupados.groupby(['ID', 'Empresa'], as_index=False).agg({
-                    'Puntaje': 'sum',
-                    'Puntaje Seccion': 'sum'
-                })
-                # Calcular porcentaje total
-                df_puntaje_total['Porcentaje Total'] = df_puntaje_total['Puntaje'] / df_puntaje_total['Puntaje Seccion']
-                
-                # Calcular puntaje por pais promedia Puntaje
-                df_puntaje_total_pais = df_resultados_agrupados.groupby(['Pais', 'Seccion'], as_index=False).agg({
-                    'Puntaje': 'mean',
-                    'Puntaje Seccion': 'first'
-                })
-                
-                # Crear el archivo Excel final
-                output_path = os.path.join(temp_dir, 'resultado_final.xlsx')
-                output = BytesIO()
-                
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_resultados_agrupados.to_excel(writer, index=False)
-                    df_puntaje_total[['ID', 'Empresa', 'Porcentaje Total']].to_excel(writer, index=False, sheet_name='General por empresas')
-                    df_puntaje_total_pais.to_excel(writer, index=False, sheet_name='General por paises')
-                
-                # Obtener el contenido del archivo en memoria
-                output.seek(0)
-                file_content = output.getvalue()
-                
-                # Si el modo debug está activado, guardar tabla_radar.xlsx localmente
-                if DEBUG_MODE:
-                    debug_dir = os.path.join(os.getcwd(), "debug_files")
-                    debug_excel_path = os.path.join(debug_dir, "tabla_radar.xlsx")
-                    with open(debug_excel_path, 'wb') as f:
-                        f.write(file_content)
-                    print(f"Debug - tabla_radar.xlsx guardado localmente en: {debug_excel_path}")
-                
-                # Subir archivo a SharePoint usando Microsoft Graph
-                upload_result = upload_sharepoint_file(
-                    access_token, 
-                    site_id, 
-                    file_content, 
-                    "tabla_radar.xlsx"
+            reportes_empresa = None
+            if por_empresa:
+                reportes_empresa = publish_company_reports(
+                    tablas, graph, access_token, drive_id,
+                    upload=lambda contenido, archivo, carpeta, content_type: upload_sharepoint_file(
+                        access_token, site_id, contenido, archivo, folder_path=carpeta,
+                        drive_id=drive_id, content_type=content_type),
+                    formato=por_empresa,
+                    base_folder=REPORTES_EMPRESA_FOLDER,
+                    workers=REPORTES_WORKERS,
+                    concurrency=REPORTES_UPLOAD_CONCURRENCY
                 )
-                
-                return jsonify({
-                    "message": "Archivo Excel generado y subido exitosamente a SharePoint",
-                    "empresas_procesadas": len(empresas),
-                    "total_resultados": len(df_resultados_agrupados),
-                    "archivo_subido": "tabla_radar.xlsx",
-                    "upload_info": upload_result.get('name', 'tabla_radar.xlsx')
-                })
-                
-            except Exception as download_error:
-                print(f"Error en la descarga de archivos: {str(download_error)}")
-                return jsonify({"error": str(download_error)}), 500
-                
+            _last_generation['etags'] = etags
+            
+            return {
+                "message": "Archivo Excel generado y subido exitosamente a SharePoint",
+                "regenerado": True,
+                "empresas_procesadas": len(empresas),
+                "total_resultados": len(df_resultados_agrupados),
+                "archivo_subido": OUTPUT_FILENAME,
+                "upload_info": upload_result.get('name', OUTPUT_FILENAME),
+                "advertencias": advertencias,
+                "cobertura": cobertura['cobertura'],
+                "reportes_empresa": reportes_empresa
+            }
+    finally:
+        if lock is not None:
+            # Cerrar el archivo libera el bloqueo
+            lock.close()
+
+@app.route('/generate-excel', methods=['GET'])
+def generate_excel():
+    # El correlation_id cubre también los errores, que se devuelven con él
+    with correlation_context() as correlation_id:
+        try:
+            por_empresa = request.args.get('por_empresa', REPORTES_EMPRESA).lower()
+            if por_empresa not in ('', 'xlsx', 'csv'):
+                return jsonify({"error": "por_empresa debe ser 'xlsx' o 'csv'"}), 400
+            return jsonify(generate_report(origen='flask', por_empresa=por_empresa))
+        except ValidationError as e:
+            logger.warning("Error de validación: %s", e, extra={'validacion': e.reporte})
+            return jsonify({"error": str(e), "validacion": e.reporte, "correlation_id": correlation_id}), 422
+        except Exception as e:
+            logger.exception("Error general: %s", e)
+            return jsonify({"error": str(e), "correlation_id": correlation_id}), 500
+
+def warm_up():
+    """Precargar el estado de este proceso antes de atender peticiones.
+
+    Carga la última ejecución del histórico en el índice de consultas, obtiene
+    el token, abre la sesión HTTP con Graph y compila la tabla de puntajes.
+    Un fallo de red no impide arrancar: se reintenta en la primera generación.
+    """
+    inicio = time.perf_counter()
+    try:
+        sync_from_history(force=True)
+        access_token = get_access_token()
+        sitio = graph.resolve_site(access_token, SITE_URL, list(SHAREPOINT_FILES.values()))
+        ruta = SHAREPOINT_FILES['puntajes']
+        with tempfile.TemporaryDirectory() as temp_dir:
+            puntajes_path = fetch_input(access_token, sitio, ruta, temp_dir)
+            get_tabla_puntajes(sitio['items'][ruta].get('eTag'), pd.read_excel(puntajes_path))
+        _warm_state['error'] = None
     except Exception as e:
-        print(f"Error general: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logger.error("Error en el precalentamiento: %s", e)
+        _warm_state['error'] = str(e)
+    _warm_state['warm'] = True
+    _warm_state['duracion'] = round(time.perf_counter() - inicio, 3)
+    logger.info("Proceso %s precalentado en %ss", os.getpid(), _warm_state['duracion'])
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Estado del proceso para balanceadores y supervisores"""
+    index = get_results_index()
+    return jsonify({
+        "status": "ok",
+        "pid": os.getpid(),
+        "warm": _warm_state['warm'],
+        "warm_up_segundos": _warm_state['duracion'],
+        "warm_up_error": _warm_state['error'],
+        "token_en_cache": time.monotonic() < _token_cache['expires_at'],
+        "puntajes_compilados": _scoring_cache['entrada'][1] is not None,
+        "resultados_run_id": index.run_id if index else None,
+        "resultados_generados": index.generado.isoformat(timespec='seconds') if index else None,
+        "watcher": watcher is not None and watcher.is_alive(),
+    })
+
+@app.route('/watcher/status', methods=['GET'])
+def watcher_status():
+    """Estado del modo watcher (última consulta a /delta, cambios pendientes, errores)"""
+    if watcher is None:
+        return jsonify({"activo": False})
+    return jsonify(watcher.status())
+
+def start_watcher():
+    """Arrancar el hilo que vigila las entradas con /delta (una sola vez por proceso)"""
+    global watcher
+    if watcher is None:
+        watcher = DeltaWatcher(
+            graph, get_access_token, SITE_URL, SHAREPOINT_FILES.values(),
+            on_change=lambda: generate_report(origen='watcher', solo_si_cambia=True),
+            interval=WATCH_INTERVAL, debounce=WATCH_DEBOUNCE
+        )
+        watcher.start()
+        logger.info("Watcher activado: consulta cada %.0fs, debounce %.0fs", WATCH_INTERVAL, WATCH_DEBOUNCE)
+    return watcher
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8090)
\ No newline at end of file
+    # Servidor de desarrollo; en producción usar wsgi.py (waitress) o gunicorn.conf.py
+    warm_up()
+    if WATCH_ENABLED:
+        start_watcher()
+    app.run(host='0.0.0.0', port=8090)
@@ -1,16 +1,45 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import pandas as pd
-import re
-import requests
-from io import BytesIO
 import os
 import json
+import logging
+import queue
 import tempfile
-from collections import defaultdict
 import threading
 from datetime import datetime
 
+from registro import configure_logging, correlation_context
+
+logger = logging.getLogger(__name__)
+
+# pandas, openpyxl y requests (vía graph_client/scoring) tardan segundos en
+# importarse dentro del ejecutable; se cargan en segundo plano después de
+# mostrar la ventana (ver preload_modules) o al generar el reporte.
+HEAVY_MODULES = ('pandas', 'openpyxl', 'requests', 'graph_client', 'scoring', 'encuesta', 'validacion', 'reportes', 'historial')
+
+# Tamaño de bloque para las descargas (permite informar progreso y cancelar)
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Intervalo y tamaño de lote con que la UI vacía la cola de eventos
+EVENT_POLL_MS = 100
+EVENT_BATCH_SIZE = 500
+
+# Textos de la barra de estado para cada etapa del proceso
+ETAPAS = {
+    'conexion': "Conectando con SharePoint",
+    'descarga': "Descargando",
+    'lectura': "Leyendo archivos Excel",
+    'puntuacion': "Puntuando respuestas",
+    'excel': "Escribiendo hojas",
+    'subida': "Subiendo reporte",
+    'empresas': "Subiendo reportes por empresa",
+}
+
+
+class ProcessCancelled(Exception):
+    """El usuario canceló la generación del reporte"""
+
+
 class ConfigManager:
     """Gestiona la configuración de la aplicación con persistencia"""
     def __init__(self, config_file='config.json'):
@@ -24,7 +53,7 @@ class ConfigManager:
                 with open(self.config_file, 'r') as f:
                     return json.load(f)
             except Exception as e:
-                print(f"Error cargando configuración: {e}")
+                logger.error("Error cargando configuración: %s", e)
                 return self.get_default_config()
         return self.get_default_config()
     
@@ -36,7 +65,7 @@ class ConfigManager:
             self.config = config
             return True
         except Exception as e:
-            print(f"Error guardando configuración: {e}")
+            logger.error("Error guardando configuración: %s", e)
             return False
     
     def get_default_config(self):
@@ -49,7 +78,10 @@ class ConfigManager:
             'encuesta_path': 'Documentos compartidos/Encuesta sobre brechas digitales en ciberseguridad en PYMEs.xlsx',
             'puntajes_path': 'Documentos compartidos/puntajes.xlsx',
             'debug_mode': False,
-            'output_filename': 'tabla_radar.xlsx'
+            'output_filename': 'tabla_radar.xlsx',
+            'scoring_workers': 0,
+            'reportes_empresa': '',
+            'reportes_empresa_folder': 'Reportes por empresa'
         }
     
     def get(self, key, default=None):
@@ -67,6 +99,7 @@ class SharePointProcessor:
     def __init__(self, config_manager):
         self.config = config_manager
         self.debug_dir = None
+        self._http = None
         
         # Crear directorio debug si está activado
         if self.config.get('debug_mode'):
@@ -74,6 +107,18 @@ class SharePointProcessor:
             if not os.path.exists(self.debug_dir):
                 os.makedirs(self.debug_dir)
     
+    @property
+    def http(self):
+        """Cliente de Graph, creado en el primer uso para no importar requests al iniciar"""
+        if self._http is None:
+            from graph_client import GraphClient
+            # graph_base_url / login_base_url permiten apuntar a fake_graph_server.py
+            self._http = GraphClient(
+                graph_url=self.config.get('graph_base_url'),
+                login_url=self.config.get('login_base_url')
+            )
+        return self._http
+    
     def get_access_token(self):
         """Obtener token de acceso usando Client Credentials Flow"""
         tenant_id = self.config.get('tenant_id')
@@ -83,7 +128,7 @@ class SharePointProcessor:
         if not all([tenant_id, client_id, client_secret]):
             raise ValueError("Faltan credenciales de configuración")
         
-        token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+        token_url = self.http.token_url(tenant_id)
         
         token_data = {
             'grant_type': 'client_credentials',
@@ -92,269 +137,211 @@ class SharePointProcessor:
             'scope': 'https://graph.microsoft.com/.default'
         }
         
-        response = requests.post(token_url, data=token_data)
+        response = self.http.post(token_url, data=token_data)
         response.raise_for_status()
         
         return response.json()['access_token']
     
-    def download_sharepoint_file(self, access_token, site_id, file_path, temp_dir):
-        """Descargar archivo desde SharePoint"""
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
+    def get_drive_id(self, access_token, site_id):
+        """Obtener el ID del drive principal del sitio"""
+        drives_url = f"{self.http.graph_url}/sites/{site_id}/drives"
         
         headers = {
             'Authorization': f'Bearer {access_token}',
             'Accept': 'application/json'
         }
         
-        drives_response = requests.get(drives_url, headers=headers)
+        drives_response = self.http.get(drives_url, headers=headers)
         drives_response.raise_for_status()
-        drives_data = drives_response.json()
         
-        drive_id = None
-        for drive in drives_data.get('value', []):
-            if drive.get('name') == 'Documents' or 'document' in drive.get('name', '').lower():
-                drive_id = drive['id']
-                break
-        
-        if not drive_id and drives_data.get('value'):
-            drive_id = drives_data['value'][0]['id']
-        
-        if not drive_id:
-            raise Exception("No se pudo encontrar un drive válido")
-        
-        clean_file_path = file_path.replace('Documentos compartidos/', '')
-        file_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{clean_file_path}:/content"
+        from graph_client import select_drive
+        return select_drive(drives_response.json())
+    
+    def download_sharepoint_file(self, access_token, site_id, file_path, temp_dir, drive_id=None, item=None,
+                                 progress_callback=None):
+        """Descargar archivo desde SharePoint en bloques, informando los bytes recibidos"""
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json'
+        }
         
-        file_response = requests.get(file_url, headers=headers)
+        if item and item.get('@microsoft.graph.downloadUrl'):
+            file_response = self.http.get(item['@microsoft.graph.downloadUrl'], stream=True)
+        else:
+            if not drive_id:
+                drive_id = self.get_drive_id(access_token, site_id)
+            
+            clean_file_path = file_path.replace('Documentos compartidos/', '')
+            file_url = f"{self.http.graph_url}/sites/{site_id}/drives/{drive_id}/root:/{clean_file_path}:/content"
+            
+            file_response = self.http.get(file_url, headers=headers, stream=True)
         file_response.raise_for_status()
         
         filename = os.path.basename(file_path)
         local_path = os.path.join(temp_dir, filename)
+        total = int(file_response.headers.get('Content-Length') or (item or {}).get('size') or 0)
+        recibidos = 0
         
-        with open(local_path, 'wb') as f:
-            f.write(file_response.content)
-        
-        if self.debug_dir:
-            debug_path = os.path.join(self.debug_dir, filename)
-            with open(debug_path, 'wb') as f:
-                f.write(file_response.content)
+        debug_file = open(os.path.join(self.debug_dir, filename), 'wb') if self.debug_dir else None
+        try:
+            with file_response, open(local_path, 'wb') as f:
+                for chunk in file_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    if debug_file:
+                        debug_file.write(chunk)
+                    recibidos += len(chunk)
+                    if progress_callback:
+                        progress_callback('descarga', recibidos, max(total, recibidos))
+        finally:
+            if debug_file:
+                debug_file.close()
         
         return local_path
     
-    def upload_sharepoint_file(self, access_token, site_id, file_content, filename):
+    def upload_sharepoint_file(self, access_token, site_id, file_content, filename, drive_id=None, folder_path="",
+                               content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'):
         """Subir archivo a SharePoint"""
-        drives_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives"
-        
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Accept': 'application/json'
-        }
-        
-        drives_response = requests.get(drives_url, headers=headers)
-        drives_response.raise_for_status()
-        drives_data = drives_response.json()
-        
-        drive_id = None
-        for drive in drives_data.get('value', []):
-            if drive.get('name') == 'Documents' or 'document' in drive.get('name', '').lower():
-                drive_id = drive['id']
-                break
-        
-        if not drive_id and drives_data.get('value'):
-            drive_id = drives_data['value'][0]['id']
-        
         if not drive_id:
-            raise Exception("No se pudo encontrar un drive válido")
+            drive_id = self.get_drive_id(access_token, site_id)
         
-        upload_url = f"https://graph.microsoft.com/v1.0/sites/{site_id}/drives/{drive_id}/root:/{filename}:/content"
+        ruta = f"{folder_path}/{filename}" if folder_path else filename
+        upload_url = f"{self.http.graph_url}/sites/{site_id}/drives/{drive_id}/root:/{ruta}:/content"
         
         upload_headers = {
             'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+            'Content-Type': content_type
         }
         
-        upload_response = requests.put(upload_url, headers=upload_headers, data=file_content)
+        upload_response = self.http.put(upload_url, headers=upload_headers, data=file_content)
         upload_response.raise_for_status()
         
         return upload_response.json()
     
-    def process_empresa_data(self, df_encuesta):
-        """Procesar datos de empresas"""
-        empresas = {}
-        
-        for _, row in df_encuesta.iterrows():
-            id_empresa = row['ID']
-            if id_empresa not in empresas:
-                empresas[id_empresa] = {'Empresa': '', 'Pais': '', 'tamano_empresa': 'Desconocido'}
-                
-            for columna, valor in row.items():
-                if isinstance(columna, str) and isinstance(valor, str):
-                    if 'Pg001' in columna:
-                        empresas[id_empresa]['Empresa'] = valor
-                    if '[Pg011.01]' in valor:
-                        empresas[id_empresa]['Pais'] = 'Costa Rica'
-                    elif '[Pg011.02]' in valor:
-                        empresas[id_empresa]['Pais'] = 'Panamá'
-                    
-                    # Procesar tamaño de empresa
-                    if empresas[id_empresa]['Pais'] == 'Panamá':
-                        if '[Pa012.01]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Micro'
-                        elif '[Pa012.02]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
-                        elif '[Pa012.03]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Mediana'
-                        elif '[Pa012.04]' in valor or '[Pa012.05]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Grande'
-                    elif empresas[id_empresa]['Pais'] == 'Costa Rica':
-                        if '[Pc012.01]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Micro'
-                        elif '[Pc012.02]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
-                        elif '[Pc012.03]' in valor or '[Pc012.04]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Mediana'
-                        elif '[Pc012.05]' in valor or '[Pc012.06]' in valor:
-                            empresas[id_empresa]['tamano_empresa'] = 'Grande'
-        
-        return empresas
-    
-    def process_data(self, log_callback=None):
-        """Procesar datos y generar Excel"""
+    def _check(self, reporte, log):
+        """Mostrar las advertencias de una validación y detener el proceso si hay errores"""
+        from validacion import ValidationError
+        for advertencia in reporte['advertencias']:
+            log(f"Advertencia: {advertencia}")
+        if not reporte['valido']:
+            raise ValidationError(reporte)
+        return reporte
+    
+    def process_data(self, log_callback=None, progress_callback=None, cancel_event=None):
+        """Procesar datos y generar Excel
+
+        ``progress_callback(etapa, actual, total)`` recibe el avance de cada
+        etapa. Si ``cancel_event`` se activa, el proceso se detiene en el
+        siguiente punto de control lanzando ``ProcessCancelled``. Los registros
+        de cada ejecución llevan un ``correlation_id``, que se devuelve en el
+        resultado.
+        """
+        # El modo debug puede cambiar desde la configuración entre ejecuciones
+        configure_logging(level="DEBUG" if self.config.get('debug_mode') else None)
+        with correlation_context() as correlation_id:
+            try:
+                result = self._process_data(log_callback, progress_callback, cancel_event)
+            except ProcessCancelled:
+                logger.info("Proceso cancelado por el usuario")
+                raise
+            except Exception as e:
+                logger.exception("Error procesando los datos: %s", e)
+                raise
+            result['correlation_id'] = correlation_id
+            return result
+
+    def _process_data(self, log_callback, progress_callback, cancel_event):
         def log(message):
             if log_callback:
                 log_callback(message)
-            print(message)
+            logger.info(message)
+        
+        import pandas as pd
+        from scoring import compute_results_parallel, build_excel
+        from encuesta import load_encuesta
+        from validacion import validate_puntajes, validate_encuesta_headers, validate_coverage
+        
+        def progress(etapa, actual, total):
+            if cancel_event is not None and cancel_event.is_set():
+                raise ProcessCancelled("Proceso cancelado por el usuario")
+            if progress_callback:
+                progress_callback(etapa, actual, total)
         
         with tempfile.TemporaryDirectory() as temp_dir:
+            progress('conexion', 0, 2)
             log("Obteniendo token de acceso...")
             access_token = self.get_access_token()
             
+            progress('conexion', 1, 2)
             log("Obteniendo información del sitio de SharePoint...")
             site_url = self.config.get('site_url')
-            site_info_url = f"https://graph.microsoft.com/v1.0/sites/{site_url}"
-            
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Accept': 'application/json'
-            }
-            
-            site_response = requests.get(site_info_url, headers=headers)
-            site_response.raise_for_status()
-            site_id = site_response.json()['id']
+            rutas = [self.config.get('encuesta_path'), self.config.get('puntajes_path')]
+            sitio = self.http.resolve_site(access_token, site_url, rutas)
+            site_id = sitio['site_id']
+            drive_id = sitio['drive_id']
             
             log(f"Site ID obtenido: {site_id}")
+            progress('conexion', 2, 2)
             
-            log("Descargando archivo de encuesta...")
-            encuesta_path = self.download_sharepoint_file(
-                access_token, site_id, 
-                self.config.get('encuesta_path'), 
-                temp_dir
-            )
+            for ruta in rutas:
+                if sitio['items'].get(ruta) is None:
+                    raise FileNotFoundError(f"No se encontró el archivo '{ruta}' en SharePoint")
             
+            # Puntajes primero: es pequeño y se valida antes de descargar la encuesta
             log("Descargando archivo de puntajes...")
             puntajes_path = self.download_sharepoint_file(
                 access_token, site_id, 
-                self.config.get('puntajes_path'), 
-                temp_dir
+                rutas[1], 
+                temp_dir,
+                drive_id=drive_id,
+                item=sitio['items'][rutas[1]],
+                progress_callback=progress
             )
             
-            log("Leyendo archivos Excel...")
-            df_encuesta = pd.read_excel(encuesta_path, sheet_name="Form1")
+            log("Validando puntajes...")
             df_puntajes = pd.read_excel(puntajes_path)
+            self._check(validate_puntajes(df_puntajes), log)
             
-            if 'ID' not in df_encuesta.columns:
-                primera_columna = df_encuesta.columns[0]
-                df_encuesta = df_encuesta.rename(columns={primera_columna: 'ID'})
-                log(f"Renombrada columna '{primera_columna}' a 'ID'")
-            
-            log("Procesando datos de empresas...")
-            empresas = self.process_empresa_data(df_encuesta)
-            
-            log("Calculando puntajes por sección...")
-            secciones_puntaje = df_puntajes.groupby('Seccion')['Puntaje'].sum().to_dict()
+            log("Descargando archivo de encuesta...")
+            encuesta_path = self.download_sharepoint_file(
+                access_token, site_id, 
+                rutas[0], 
+                temp_dir,
+                drive_id=drive_id,
+                item=sitio['items'][rutas[0]],
+                progress_callback=progress
+            )
             
-            secciones_puntaje_pequena = defaultdict(int)
-            secciones_puntaje_mediana = defaultdict(int)
+            log("Validando encabezados de la encuesta...")
+            self._check(validate_encuesta_headers(encuesta_path, df_puntajes), log)
             
-            for _, row in df_puntajes.iterrows():
-                if row['Respuesta Pequeña'] and not pd.isna(row['Respuesta Pequeña']):
-                    secciones_puntaje_pequena[row['Seccion']] += row['Puntaje']
-                if row['Respuesta Mediana'] and not pd.isna(row['Respuesta Mediana']):
-                    secciones_puntaje_mediana[row['Seccion']] += row['Puntaje']
+            log("Leyendo archivos Excel...")
+            progress('lectura', 0, 1)
+            df_encuesta = load_encuesta(encuesta_path, df_puntajes)
+            progress('lectura', 1, 1)
+            log(f"Encuesta leída: {len(df_encuesta)} filas, {df_encuesta.shape[1]} columnas útiles")
+            cobertura = self._check(validate_coverage(df_encuesta, df_puntajes), log)['cobertura']
+            log(f"Códigos de respuesta reconocidos: {cobertura['codigos_reconocidos']} "
+                f"de {cobertura['codigos_encuesta']}")
             
             log("Procesando respuestas...")
-            resultados = []
-            
-            for _, row_encuesta in df_encuesta.iterrows():
-                id_empresa = row_encuesta['ID']
-                empresa_info = empresas.get(id_empresa, {})
-                if not empresa_info.get('Empresa'):
-                    continue
-                
-                for columna, respuesta in row_encuesta.items():
-                    if not isinstance(respuesta, str):
-                        continue
-                        
-                    respuesta_match = re.search(r"\[([A-Za-z0-9_.]+)\]", str(respuesta))
-                    if not respuesta_match:
-                        continue
-                        
-                    respuesta_code = respuesta_match.group(1)
-                    
-                    puntaje_match = df_puntajes[
-                        (df_puntajes['Respuesta Pequeña'] == respuesta_code) |
-                        (df_puntajes['Respuesta Mediana'] == respuesta_code)
-                    ]
-                    
-                    if not puntaje_match.empty:
-                        tamano = 'Pequeña' if respuesta_code == puntaje_match['Respuesta Pequeña'].iloc[0] else 'Mediana'
-                        seccion = puntaje_match['Seccion'].iloc[0]
-                        
-                        resultados.append({
-                            'ID': id_empresa,
-                            'Empresa': empresa_info.get('Empresa', ''),
-                            'Tamaño': tamano,
-                            'Tamaño de empresa': empresa_info.get('tamano_empresa', 'Desconocido'),
-                            'Pais': empresa_info.get('Pais', ''),
-                            'Puntaje': float(puntaje_match['Puntaje'].iloc[0]),
-                            'Seccion': seccion,
-                            'Puntaje Seccion': secciones_puntaje_pequena[seccion] if tamano == 'Pequeña' else secciones_puntaje_mediana[seccion]
-                        })
-            
-            if not resultados:
-                raise ValueError("No se encontraron resultados para procesar")
-            
-            log(f"Generando archivo Excel con {len(resultados)} resultados...")
-            df_resultados = pd.DataFrame(resultados)
-            
-            df_resultados_agrupados = df_resultados.groupby(
-                ['ID', 'Empresa', 'Tamaño', 'Pais', 'Seccion', 'Tamaño de empresa'],
-                as_index=False
-            ).agg({
-                'Puntaje': 'sum',
-                'Puntaje Seccion': 'first'
-            })
-            
-            df_puntaje_total = df_resultados_agrupados.groupby(['ID', 'Empresa'], as_index=False).agg({
-                'Puntaje': 'sum',
-                'Puntaje Seccion': 'sum'
-            })
-            df_puntaje_total['Porcentaje Total'] = df_puntaje_total['Puntaje'] / df_puntaje_total['Puntaje Seccion']
+            # 0 = un proceso por núcleo; solo se usa con exportaciones grandes
+            tablas = compute_results_parallel(df_encuesta, df_puntajes,
+                                              workers=self.config.get('scoring_workers', 0),
+                                              progress_callback=progress)
             
-            df_puntaje_total_pais = df_resultados_agrupados.groupby(['Pais', 'Seccion'], as_index=False).agg({
-                'Puntaje': 'mean',
-                'Puntaje Seccion': 'first'
-            })
+            historial_path = self.config.get('historial_path', 'historial.sqlite')
+            if historial_path:
+                from historial import ResultsStore, file_sha256
+                run_id = ResultsStore(historial_path).save_run(
+                    tablas,
+                    encuesta_hash=file_sha256(encuesta_path),
+                    puntajes_hash=file_sha256(puntajes_path),
+                    origen='escritorio'
+                )
+                log(f"Resultados guardados en el histórico ({historial_path}, ejecución {run_id})")
             
-            output = BytesIO()
-            
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df_resultados_agrupados.to_excel(writer, index=False)
-                df_puntaje_total[['ID', 'Empresa', 'Porcentaje Total']].to_excel(writer, index=False, sheet_name='General por empresas')
-                df_puntaje_total_pais.to_excel(writer, index=False, sheet_name='General por paises')
-            
-            output.seek(0)
-            file_content = output.getvalue()
+            log(f"Generando archivo Excel con {len(tablas['resultados'])} resultados...")
+            file_content = build_excel(tablas, progress_callback=progress)
             
             if self.debug_dir:
                 debug_excel_path = os.path.join(self.debug_dir, self.config.get('output_filename'))
@@ -363,18 +350,43 @@ class SharePointProcessor:
                 log(f"Archivo guardado localmente en: {debug_excel_path}")
             
             log("Subiendo archivo a SharePoint...")
+            progress('subida', 0, len(file_content))
             upload_result = self.upload_sharepoint_file(
                 access_token, 
                 site_id, 
                 file_content, 
-                self.config.get('output_filename')
+                self.config.get('output_filename'),
+                drive_id=drive_id
             )
+            if progress_callback:
+                progress_callback('subida', len(file_content), len(file_content))
+            
+            formato = self.config.get('reportes_empresa', '')
+            reportes_empresa = None
+            if formato:
+                from reportes import publish_company_reports
+                log(f"Generando reportes por empresa ({formato})...")
+                reportes_empresa = publish_company_reports(
+                    tablas, self.http, access_token, drive_id,
+                    upload=lambda contenido, archivo, carpeta, content_type: self.upload_sharepoint_file(
+                        access_token, site_id, contenido, archivo, drive_id=drive_id,
+                        folder_path=carpeta, content_type=content_type),
+                    formato=formato,
+                    base_folder=self.config.get('reportes_empresa_folder', 'Reportes por empresa'),
+                    workers=self.config.get('scoring_workers', 0),
+                    progress_callback=progress
+                )
+                log(f"Reportes por empresa: {reportes_empresa['subidos']} subidos, "
+                    f"{reportes_empresa['sin_cambios']} sin cambios")
+                for error in reportes_empresa['errores']:
+                    log(f"Error subiendo {error['archivo']}: {error['error']}")
             
             return {
                 "success": True,
-                "empresas_procesadas": len(empresas),
-                "total_resultados": len(df_resultados_agrupados),
-                "archivo_subido": self.config.get('output_filename')
+                "empresas_procesadas": len(tablas['empresas']),
+                "total_resultados": len(tablas['resultados']),
+                "archivo_subido": self.config.get('output_filename'),
+                "reportes_empresa": reportes_empresa
             }
 
 
@@ -464,7 +476,8 @@ class ConfigWindow(tk.Toplevel):
     
     def save_config(self):
         """Guardar configuración"""
-        new_config = {}
+        # Conservar las claves avanzadas que no tienen campo en la ventana
+        new_config = dict(self.config_manager.config)
         for field_name, entry in self.entries.items():
             new_config[field_name] = entry.get()
         
@@ -489,8 +502,15 @@ class MainApplication(tk.Tk):
         self.config_manager = ConfigManager()
         self.processor = SharePointProcessor(self.config_manager)
         
+        # Canal hilo de trabajo -> UI: solo el hilo principal toca los widgets
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        
         self.create_widgets()
         self.check_config()
+        self.after(EVENT_POLL_MS, self.poll_events)
+        # Precargar los módulos pesados cuando la ventana ya está visible
+        self.after_idle(self.preload_modules)
     
     def create_widgets(self):
         """Crear widgets de la interfaz principal"""
@@ -518,6 +538,11 @@ class MainApplication(tk.Tk):
                                      style='Accent.TButton')
         self.process_btn.grid(row=0, column=1, padx=5)
         
+        self.cancel_btn = ttk.Button(button_frame, text="■ Cancelar", 
+                                    command=self.cancel_processing,
+                                    state='disabled')
+        self.cancel_btn.grid(row=0, column=2, padx=5)
+        
         # Separador
         ttk.Separator(self, orient='horizontal').grid(row=1, column=0, sticky=(tk.W, tk.E), pady=5)
         
@@ -537,7 +562,7 @@ class MainApplication(tk.Tk):
         progress_label = ttk.Label(self, textvariable=self.progress_var)
         progress_label.grid(row=3, column=0, sticky=tk.W, padx=10, pady=5)
         
-        self.progress_bar = ttk.Progressbar(self, mode='indeterminate')
+        self.progress_bar = ttk.Progressbar(self, mode='determinate', maximum=100)
         self.progress_bar.grid(row=4, column=0, sticky=(tk.W, tk.E), padx=10, pady=(0, 10))
         
         # Configurar pesos de las filas/columnas para que se expandan
@@ -550,6 +575,19 @@ class MainApplication(tk.Tk):
         self.log("Aplicación iniciada")
         self.log(f"Fecha: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     
+    def preload_modules(self):
+        """Importar los módulos pesados en un hilo de fondo"""
+        def preload():
+            import importlib
+            for module in HEAVY_MODULES:
+                try:
+                    importlib.import_module(module)
+                except ImportError as e:
+                    # El error real se mostrará al generar el reporte
+                    logger.warning("No se pudo precargar %s: %s", module, e)
+        
+        threading.Thread(target=preload, daemon=True).start()
+    
     def check_config(self):
         """Verificar si la configuración está completa"""
         required_fields = ['tenant_id', 'client_id', 'client_secret']
@@ -561,11 +599,59 @@ class MainApplication(tk.Tk):
                                   "Por favor, configura las credenciales antes de generar reportes.")
     
     def log(self, message):
-        """Agregar mensaje al log"""
+        """Agregar mensaje al log (se puede llamar desde cualquier hilo)"""
         timestamp = datetime.now().strftime('%H:%M:%S')
-        self.log_text.insert(tk.END, f"[{timestamp}] {message}\n")
+        self.events.put(('log', f"[{timestamp}] {message}\n"))
+    
+    def report_progress(self, etapa, actual, total):
+        """Informar el avance de una etapa (se puede llamar desde cualquier hilo)"""
+        self.events.put(('progress', (etapa, actual, total)))
+    
+    def poll_events(self):
+        """Vaciar la cola de eventos del hilo de trabajo (hilo principal)"""
+        lineas = []
+        progreso = None
+        try:
+            for _ in range(EVENT_BATCH_SIZE):
+                tipo, datos = self.events.get_nowait()
+                if tipo == 'log':
+                    lineas.append(datos)
+                elif tipo == 'progress':
+                    # Solo importa el último avance de cada lote
+                    progreso = datos
+                else:
+                    if lineas:
+                        self.write_log(''.join(lineas))
+                        lineas = []
+                    self.handle_result(tipo, datos)
+        except queue.Empty:
+            pass
+        
+        if lineas:
+            self.write_log(''.join(lineas))
+        if progreso:
+            self.show_progress(*progreso)
+        
+        self.after(EVENT_POLL_MS, self.poll_events)
+    
+    def write_log(self, text):
+        """Insertar texto en el área de log (hilo principal)"""
+        self.log_text.insert(tk.END, text)
         self.log_text.see(tk.END)
-        self.update_idletasks()
+    
+    def show_progress(self, etapa, actual, total):
+        """Actualizar barra y texto de progreso (hilo principal)"""
+        porcentaje = 100 * actual / total if total else 0
+        self.progress_bar['value'] = porcentaje
+        if etapa == 'descarga' or etapa == 'subida':
+            detalle = f"{actual / 1048576:.1f} / {total / 1048576:.1f} MB"
+        elif etapa == 'puntuacion':
+            detalle = f"{actual} / {total} filas"
+        elif etapa == 'excel':
+            detalle = f"{actual} / {total} hojas"
+        else:
+            detalle = f"{actual} / {total}"
+        self.progress_var.set(f"{ETAPAS.get(etapa, etapa)}: {detalle} ({porcentaje:.0f}%)")
     
     def open_config(self):
         """Abrir ventana de configuración"""
@@ -574,47 +660,73 @@ class MainApplication(tk.Tk):
     def start_processing(self):
         """Iniciar procesamiento en un hilo separado"""
         self.process_btn.config(state='disabled')
-        self.progress_bar.start()
+        self.cancel_btn.config(state='normal')
+        self.cancel_event.clear()
+        self.progress_bar['value'] = 0
         self.progress_var.set("Procesando...")
         
         # Ejecutar en un hilo separado para no bloquear la UI
         thread = threading.Thread(target=self.process_data, daemon=True)
         thread.start()
     
+    def cancel_processing(self):
+        """Pedir al hilo de trabajo que se detenga en el siguiente punto de control"""
+        self.cancel_event.set()
+        self.cancel_btn.config(state='disabled')
+        self.progress_var.set("Cancelando...")
+        self.log("Cancelando proceso...")
+    
     def process_data(self):
         """Procesar datos (ejecutado en hilo separado)"""
         try:
             self.log("\n" + "="*50)
             self.log("Iniciando generación de reporte...")
             
-            result = self.processor.process_data(log_callback=self.log)
+            result = self.processor.process_data(
+                log_callback=self.log,
+                progress_callback=self.report_progress,
+                cancel_event=self.cancel_event
+            )
             
             self.log("="*50)
             self.log("✓ Proceso completado exitosamente")
             self.log(f"  - Empresas procesadas: {result['empresas_procesadas']}")
             self.log(f"  - Total resultados: {result['total_resultados']}")
             self.log(f"  - Archivo subido: {result['archivo_subido']}")
+            self.events.put(('done', result))
             
-            self.after(0, lambda: messagebox.showinfo("Éxito", 
-                f"Reporte generado exitosamente\n\n"
-                f"Empresas procesadas: {result['empresas_procesadas']}\n"
-                f"Archivo: {result['archivo_subido']}"))
-            
+        except ProcessCancelled:
+            self.log("✗ Proceso cancelado")
+            self.events.put(('cancelled', None))
+        
         except Exception as e:
             error_msg = f"✗ Error: {str(e)}"
             self.log(error_msg)
-            self.after(0, lambda: messagebox.showerror("Error", str(e)))
-        
-        finally:
-            self.after(0, self.finish_processing)
+            self.events.put(('error', str(e)))
+    
+    def handle_result(self, tipo, datos):
+        """Mostrar el resultado del proceso y restaurar la UI (hilo principal)"""
+        self.finish_processing()
+        if tipo == 'done':
+            messagebox.showinfo("Éxito", 
+                f"Reporte generado exitosamente\n\n"
+                f"Empresas procesadas: {datos['empresas_procesadas']}\n"
+                f"Archivo: {datos['archivo_subido']}")
+        elif tipo == 'error':
+            messagebox.showerror("Error", datos)
     
     def finish_processing(self):
         """Finalizar procesamiento (ejecutado en hilo principal)"""
-        self.progress_bar.stop()
         self.process_btn.config(state='normal')
+        self.cancel_btn.config(state='disabled')
+        self.progress_bar['value'] = 0
         self.progress_var.set("Listo")
 
 
 if __name__ == '__main__':
+    # Necesario en el ejecutable de Windows para los procesos de puntuación en paralelo
+    import multiprocessing
+    multiprocessing.freeze_support()
+    configure_logging()
     app = MainApplication()
     app.mainloop()
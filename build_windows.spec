@@ -26,11 +26,25 @@ a = Analysis(
         'os',
         'tempfile',
         'io',
+        'queue',
+        'logging',
+        'importlib',
+        'multiprocessing',
+        'concurrent.futures',
+        # Se importan de forma diferida (al generar el reporte)
+        'graph_client',
+        'scoring',
+        'encuesta',
+        'validacion',
+        'reportes',
+        'historial',
+        'sqlite3',
     ],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Paquetes que no usa la app de escritorio: menos archivos que extraer al iniciar
+    excludes=['matplotlib', 'scipy', 'IPython', 'pytest', 'pyarrow', 'flask', 'dotenv'],
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,
@@ -50,7 +64,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,  # Descomprimir con UPX en cada arranque retrasa la aparición de la ventana
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,  # False para que no muestre consola, True para debug
@@ -0,0 +1,347 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from io import BytesIO
+
+import numpy as np
+from flask import Blueprint, jsonify, request, Response
+
+logger = logging.getLogger(__name__)
+
+consultas_bp = Blueprint('consultas', __name__, url_prefix='/resultados')
+
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Cada cuántos segundos se comprueba si otro proceso guardó una ejecución más reciente
+SYNC_INTERVAL = 5
+
+# Parámetros de consulta -> columna del DataFrame
+FILTROS = {
+    'id': 'ID',
+    'pais': 'Pais',
+    'seccion': 'Seccion',
+    'tamano': 'Tamaño de empresa',
+}
+
+
+class QueryError(ValueError):
+    """Error de parámetros en una consulta de resultados"""
+
+
+class ResultadosIndex:
+    """Índices y agregados precalculados de una ejecución de puntuación.
+
+    Se construye una sola vez al terminar ``generate_excel`` para que las
+    consultas no tengan que recalcular nada: cada tabla guarda, por cada
+    columna filtrable, las posiciones de fila de cada valor.
+    """
+
+    def __init__(self, tablas, generado=None, run_id=None):
+        self.generado = generado or datetime.now()
+        self.run_id = run_id
+        resultados = tablas['resultados'].reset_index(drop=True)
+
+        # Pais y tamaño de cada empresa junto con su porcentaje total
+        perfil = resultados.drop_duplicates('ID')[['ID', 'Pais', 'Tamaño de empresa']]
+        empresas = tablas['totales'].merge(perfil, on='ID', how='left')
+        empresas = empresas[['ID', 'Empresa', 'Pais', 'Tamaño de empresa',
+                             'Puntaje', 'Puntaje Seccion', 'Porcentaje Total']]
+
+        # Detalle por sección de cada empresa (datos del gráfico de radar)
+        secciones_empresa = resultados.groupby(['ID', 'Empresa', 'Pais', 'Tamaño de empresa', 'Seccion'],
+                                               as_index=False).agg({
+            'Puntaje': 'sum',
+            'Puntaje Seccion': 'sum'
+        })
+        secciones_empresa['Porcentaje'] = _ratio(secciones_empresa['Puntaje'], secciones_empresa['Puntaje Seccion'])
+
+        paises = tablas['paises'].copy()
+        paises['Porcentaje'] = _ratio(paises['Puntaje'], paises['Puntaje Seccion'])
+
+        self.tablas = {
+            'detalle': self._indexar(resultados),
+            'empresas': self._indexar(empresas),
+            'secciones_empresa': self._indexar(secciones_empresa),
+            'paises': self._indexar(paises),
+            'secciones': self._indexar(self._rollup(secciones_empresa, ['Seccion'])),
+            'tamanos': self._indexar(self._rollup(secciones_empresa, ['Tamaño de empresa', 'Seccion'])),
+            'paises_tamanos': self._indexar(self._rollup(secciones_empresa, ['Pais', 'Tamaño de empresa', 'Seccion'])),
+        }
+
+    @staticmethod
+    def _rollup(secciones_empresa, columnas):
+        """Promedios por grupo sobre el detalle por sección de cada empresa"""
+        rollup = secciones_empresa.groupby(columnas, as_index=False).agg(
+            Empresas=('ID', 'nunique'),
+            Puntaje=('Puntaje', 'mean'),
+            **{'Puntaje Seccion': ('Puntaje Seccion', 'mean')},
+            Porcentaje=('Porcentaje', 'mean'),
+        )
+        return rollup
+
+    @staticmethod
+    def _indexar(df):
+        """Guardar el DataFrame junto con las posiciones de fila por valor filtrable"""
+        df = df.reset_index(drop=True)
+        indices = {}
+        for columna in FILTROS.values():
+            if columna in df.columns:
+                indices[columna] = {
+                    _clave(valor): posiciones
+                    for valor, posiciones in df.groupby(columna, sort=False).indices.items()
+                }
+        return {'df': df, 'indices': indices}
+
+    def consultar(self, tabla, filtros):
+        """Filtrar una tabla usando los índices precalculados"""
+        entrada = self.tablas[tabla]
+        df = entrada['df']
+        posiciones = None
+
+        for parametro, valores in filtros.items():
+            columna = FILTROS[parametro]
+            if columna not in entrada['indices']:
+                raise QueryError(f"El filtro '{parametro}' no aplica a '{tabla}'")
+            indice = entrada['indices'][columna]
+            seleccion = [indice[_clave(v)] for v in valores if _clave(v) in indice]
+            encontradas = np.unique(np.concatenate(seleccion)) if seleccion else np.array([], dtype=np.intp)
+            posiciones = encontradas if posiciones is None else np.intersect1d(posiciones, encontradas)
+
+        if posiciones is None:
+            return df
+        return df.iloc[posiciones]
+
+
+_estado = {'index': None, 'historial': None, 'sincronizado': 0}
+_lock = threading.Lock()
+_sync_lock = threading.Lock()
+
+
+def publish_results(tablas, run_id=None, generado=None):
+    """Reemplazar los resultados consultables por los de la última ejecución"""
+    index = ResultadosIndex(tablas, generado=generado, run_id=run_id)
+    with _lock:
+        _estado['index'] = index
+    return index
+
+
+def sync_from_history(force=False):
+    """Cargar la última ejecución del histórico si es más reciente que la publicada.
+
+    Con varios workers solo uno genera cada informe; los demás lo recogen de
+    aquí (como mucho cada ``SYNC_INTERVAL`` segundos) en vez de recalcularlo.
+    """
+    store = _estado['historial']
+    if store is None:
+        return get_results_index()
+    if not force and time.monotonic() - _estado['sincronizado'] < SYNC_INTERVAL:
+        return get_results_index()
+    if not _sync_lock.acquire(blocking=False):
+        # Otro hilo ya está cargando la ejecución
+        return get_results_index()
+    try:
+        _estado['sincronizado'] = time.monotonic()
+        ultima = store.list_runs(limit=1)
+        if ultima.empty:
+            return get_results_index()
+        run_id = int(ultima['run_id'].iloc[0])
+        actual = get_results_index()
+        if actual is not None and actual.run_id is not None and actual.run_id >= run_id:
+            return actual
+        tablas = store.load_run(run_id)
+        if not _run_complete(tablas, ultima.iloc[0]):
+            # No publicar una ejecución a medias: se reintenta en la siguiente petición
+            logger.warning("Ejecución %s del histórico incompleta; no se publica", run_id, extra={'run_id': run_id})
+            _estado['sincronizado'] = 0
+            return actual
+        logger.info("Resultados cargados desde el histórico: run_id %s", run_id, extra={'run_id': run_id})
+        return publish_results(tablas, run_id=run_id, generado=datetime.fromisoformat(ultima['fecha'].iloc[0]))
+    finally:
+        _sync_lock.release()
+
+
+def _run_complete(tablas, ejecucion):
+    """Las tablas cargadas tienen las filas que la ejecución dice tener (y totales si hay resultados)"""
+    if tablas is None:
+        return False
+    if len(tablas['resultados']) and tablas['totales'].empty:
+        return False
+    return len(tablas['resultados']) == ejecucion['resultados'] and len(tablas['totales']) == ejecucion['empresas']
+
+
+def configure_history(store):
+    """Registrar el histórico (historial.ResultsStore) para las rutas /resultados/historial"""
+    _estado['historial'] = store
+
+
+def get_results_index():
+    """Obtener el índice de la última ejecución (o None si no hay ninguna)"""
+    with _lock:
+        return _estado['index']
+
+
+def _ratio(numerador, denominador):
+    return (numerador / denominador.replace(0, np.nan)).astype(float)
+
+
+def _clave(valor):
+    """Normalizar valores para que '12' y 12 apunten a la misma entrada del índice"""
+    if isinstance(valor, (np.integer, np.floating)):
+        valor = valor.item()
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip().casefold()
+
+
+def _leer_filtros():
+    filtros = {}
+    for parametro in FILTROS:
+        valores = [v for raw in request.args.getlist(parametro) for v in raw.split(',') if v.strip()]
+        if valores:
+            filtros[parametro] = valores
+    return filtros
+
+
+def _leer_paginacion():
+    try:
+        page = int(request.args.get('page', 1))
+        page_size = int(request.args.get('page_size', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise QueryError("'page' y 'page_size' deben ser enteros")
+    if page < 1 or page_size < 1:
+        raise QueryError("'page' y 'page_size' deben ser mayores que cero")
+    return page, min(page_size, MAX_PAGE_SIZE)
+
+
+def _quiere_arrow():
+    formato = request.args.get('format', '').lower()
+    if formato:
+        return formato == 'arrow'
+    return request.accept_mimetypes.best_match(['application/json', ARROW_MIME]) == ARROW_MIME
+
+
+def _responder(generado, df, paginar=True):
+    total = len(df)
+    page, page_size = _leer_paginacion() if paginar else (1, max(total, 1))
+    pagina = df.iloc[(page - 1) * page_size: page * page_size]
+
+    if _quiere_arrow():
+        try:
+            import pyarrow as pa
+        except ImportError:
+            return jsonify({"error": "El formato Arrow requiere el paquete 'pyarrow'"}), 406
+        tabla = pa.Table.from_pandas(pagina, preserve_index=False)
+        buffer = BytesIO()
+        with pa.ipc.new_stream(buffer, tabla.schema) as writer:
+            writer.write_table(tabla)
+        response = Response(buffer.getvalue(), mimetype=ARROW_MIME)
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Page'] = str(page)
+        response.headers['X-Page-Size'] = str(page_size)
+        return response
+
+    # NaN no es JSON válido
+    registros = pagina.astype(object).where(pagina.notna(), None).to_dict(orient='records')
+    return jsonify({
+        "generado": generado.isoformat(timespec='seconds') if generado else None,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "items": registros
+    })
+
+
+@consultas_bp.before_request
+def _sincronizar():
+    sync_from_history()
+
+
+def _consulta(tabla, filtros=None, paginar=True):
+    index = get_results_index()
+    if index is None:
+        return jsonify({"error": "Todavía no hay resultados; ejecute /generate-excel primero"}), 404
+    try:
+        filtros = _leer_filtros() if filtros is None else filtros
+        return _responder(index.generado, index.consultar(tabla, filtros), paginar)
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@consultas_bp.route('/empresas', methods=['GET'])
+def empresas():
+    """Porcentaje total por empresa. Filtros: id, pais, tamano"""
+    return _consulta('empresas')
+
+
+@consultas_bp.route('/empresas/<id_empresa>', methods=['GET'])
+def empresa(id_empresa):
+    """Detalle por sección de una empresa (datos del gráfico de radar)"""
+    filtros = _leer_filtros()
+    filtros['id'] = [id_empresa]
+    return _consulta('secciones_empresa', filtros, paginar=False)
+
+
+@consultas_bp.route('/detalle', methods=['GET'])
+def detalle():
+    """Hoja principal de resultados. Filtros: id, pais, seccion, tamano"""
+    return _consulta('detalle')
+
+
+@consultas_bp.route('/paises', methods=['GET'])
+def paises():
+    """Promedio por país y sección (hoja 'General por paises'). Filtros: pais, seccion"""
+    return _consulta('paises')
+
+
+@consultas_bp.route('/secciones', methods=['GET'])
+def secciones():
+    """Promedio por sección; con pais y/o tamano usa los agregados correspondientes"""
+    filtros = _leer_filtros()
+    if 'pais' in filtros:
+        return _consulta('paises' if 'tamano' not in filtros else 'paises_tamanos', filtros)
+    if 'tamano' in filtros:
+        return _consulta('tamanos', filtros)
+    return _consulta('secciones', filtros)
+
+
+@consultas_bp.route('/tamanos', methods=['GET'])
+def tamanos():
+    """Promedio por tamaño de empresa y sección. Filtros: tamano, seccion, pais"""
+    filtros = _leer_filtros()
+    return _consulta('paises_tamanos' if 'pais' in filtros else 'tamanos', filtros)
+
+
+def _historial(consulta):
+    store = _estado['historial']
+    if store is None:
+        return jsonify({"error": "El histórico de resultados está desactivado"}), 404
+    try:
+        return _responder(None, consulta(store))
+    except QueryError as e:
+        return jsonify({"error": str(e)}), 400
+
+
+@consultas_bp.route('/historial/ejecuciones', methods=['GET'])
+def historial_ejecuciones():
+    """Ejecuciones guardadas con su fecha y hashes de entrada"""
+    return _historial(lambda store: store.list_runs(limit=MAX_PAGE_SIZE))
+
+
+@consultas_bp.route('/historial/empresas/<id_empresa>', methods=['GET'])
+def historial_empresa(id_empresa):
+    """Serie del porcentaje total de una empresa a lo largo de las ejecuciones"""
+    return _historial(lambda store: store.company_history(id_empresa))
+
+
+@consultas_bp.route('/historial/empresas/<id_empresa>/secciones', methods=['GET'])
+def historial_empresa_secciones(id_empresa):
+    """Serie del puntaje por sección de una empresa. Filtro: seccion"""
+    return _historial(lambda store: store.company_sections_history(id_empresa, request.args.get('seccion')))
+
+
+@consultas_bp.route('/historial/paises', methods=['GET'])
+def historial_paises():
+    """Serie de la hoja 'General por paises'. Filtros: pais, seccion"""
+    return _historial(lambda store: store.country_history(request.args.get('pais'), request.args.get('seccion')))
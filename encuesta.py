@@ -0,0 +1,181 @@
+"""Lectura de la exportación de la encuesta (hoja "Form1") con poca memoria.
+
+En lugar de ``pd.read_excel``, que carga todas las celdas de todas las
+columnas como texto antes de construir el DataFrame, se recorre la hoja fila a
+fila con openpyxl en modo solo lectura y se guardan únicamente las columnas
+que intervienen en la puntuación:
+
+- la columna ID (o la primera, que se renombra a ID como antes),
+- las preguntas de perfil (``scoring.PREGUNTAS_PERFIL``),
+- las preguntas con algún código de respuesta en la tabla de puntajes.
+
+Las columnas cuyo encabezado lleva uno de esos códigos de pregunta (p. ej.
+"Pg105. ..." para las respuestas "[Pg105.02]") se guardan completas. La
+puntuación mira los valores de todas las celdas, no los encabezados, así que
+del resto de columnas se guardan solo las celdas con un código de respuesta
+de esas preguntas (el resto quedan vacías) y la columna se descarta si no
+tiene ninguna: una pregunta titulada "País" o "¿Tiene respaldos?" puntúa
+igual que con ``read_excel``.
+"""
+import logging
+
+import pandas as pd
+from openpyxl import load_workbook
+
+from scoring import PREGUNTAS_PERFIL, RESPUESTA_RE
+
+logger = logging.getLogger(__name__)
+
+HOJA_ENCUESTA = "Form1"
+CHUNK_SIZE = 5000
+
+
+def scored_question_codes(df_puntajes):
+    """Códigos de pregunta ("Pg105") de todas las respuestas con puntaje"""
+    codigos = set()
+    for columna in ('Respuesta Pequeña', 'Respuesta Mediana'):
+        for codigo in df_puntajes[columna]:
+            if isinstance(codigo, str):
+                codigos.add(codigo.rsplit('.', 1)[0])
+    return codigos
+
+
+def select_columns(encabezados, df_puntajes=None):
+    """Posiciones de las columnas que se guardan completas, por su encabezado.
+
+    Sin ``df_puntajes`` son todas. Las demás columnas se filtran por el valor
+    de sus celdas (ver ``_celda_puntuable``).
+    """
+    if df_puntajes is None:
+        return list(range(len(encabezados)))
+
+    codigos = scored_question_codes(df_puntajes) | set(PREGUNTAS_PERFIL)
+    indices = []
+    for i, encabezado in enumerate(encabezados):
+        if encabezado == 'ID' or (i == 0 and 'ID' not in encabezados) or \
+                any(codigo in encabezado for codigo in codigos):
+            indices.append(i)
+    return indices
+
+
+def _celda_puntuable(valor, preguntas):
+    """El valor si contiene un código de respuesta de ``preguntas`` ("[Pg105.02]"), si no None.
+
+    Incluye todo lo que puntuación y perfil pueden usar: el primer código
+    de la celda si está en puntajes y las marcas de país y tamaño.
+    """
+    if isinstance(valor, str) and '[' in valor:
+        for codigo in RESPUESTA_RE.findall(valor):
+            if codigo.rsplit('.', 1)[0] in preguntas:
+                return valor
+    return None
+
+
+def _encabezados(fila):
+    """Nombres de columna como los de read_excel: 'Unnamed: n' y duplicados con '.1'"""
+    nombres = []
+    vistos = {}
+    for i, valor in enumerate(fila):
+        nombre = f"Unnamed: {i}" if valor is None else str(valor)
+        if nombre in vistos:
+            vistos[nombre] += 1
+            nombre = f"{nombre}.{vistos[nombre]}"
+        else:
+            vistos[nombre] = 0
+        nombres.append(nombre)
+    return nombres
+
+
+def read_headers(path, sheet_name=HOJA_ENCUESTA):
+    """Leer solo la fila de encabezados (sin recorrer el resto de la hoja)"""
+    libro = load_workbook(path, read_only=True, data_only=True)
+    try:
+        filas = libro[sheet_name].iter_rows(min_row=1, max_row=1, values_only=True)
+        return _encabezados(next(filas, ()))
+    finally:
+        libro.close()
+
+
+def _valor(valor):
+    # read_excel convierte los números enteros guardados como float a int
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+
+def _tipar(df, categoricas):
+    """Respuestas repetidas ("Sí [Pg105.03]") como category: un entero por celda"""
+    for columna in categoricas:
+        df[columna] = df[columna].astype('category')
+    return df
+
+
+def iter_encuesta_chunks(path, df_puntajes=None, chunk_size=CHUNK_SIZE, sheet_name=HOJA_ENCUESTA):
+    """Leer la encuesta en bloques de ``chunk_size`` filas.
+
+    Todos los bloques tienen las mismas columnas, en el orden de la hoja (el
+    país debe verse antes que el tamaño de empresa, como al recorrer la fila
+    completa). Las columnas filtradas por valor se listan en
+    ``df.attrs['filtradas']``; ``load_encuesta`` quita las que quedan vacías.
+    """
+    libro = load_workbook(path, read_only=True, data_only=True)
+    try:
+        filas = libro[sheet_name].iter_rows(values_only=True)
+        encabezados = _encabezados(next(filas, ()))
+        completas = set(select_columns(encabezados, df_puntajes))
+        preguntas = scored_question_codes(df_puntajes) | set(PREGUNTAS_PERFIL) if df_puntajes is not None else set()
+        columnas = list(encabezados)
+        if 'ID' not in encabezados and columnas:
+            logger.debug("Renombrada columna '%s' a 'ID'", columnas[0])
+            columnas[0] = 'ID'
+        filtradas = [columnas[i] for i in range(len(columnas)) if i not in completas]
+        # Texto libre único por empresa (ID y nombre) se queda como object
+        categoricas = [c for c in columnas[1:] if 'Pg001' not in c]
+
+        bloque = []
+        emitidos = 0
+
+        def _bloque(bloque):
+            df = _tipar(pd.DataFrame(bloque, columns=columnas), categoricas)
+            df.attrs['filtradas'] = filtradas
+            return df
+
+        for fila in filas:
+            # Como read_excel: solo se saltan las filas sin ningún valor
+            if all(v is None for v in fila):
+                continue
+            valores = [None if i >= len(fila) else _valor(fila[i]) if i in completas
+                       else _celda_puntuable(fila[i], preguntas) for i in range(len(columnas))]
+            bloque.append(valores)
+            if len(bloque) >= chunk_size:
+                yield _bloque(bloque)
+                emitidos += 1
+                bloque = []
+        if bloque or not emitidos:
+            yield _bloque(bloque)
+    finally:
+        libro.close()
+
+
+def load_encuesta(path, df_puntajes=None, chunk_size=CHUNK_SIZE, sheet_name=HOJA_ENCUESTA):
+    """Encuesta completa con solo las columnas útiles y respuestas categóricas.
+
+    Sin ``df_puntajes`` no se poda ninguna columna (solo se tipan).
+    """
+    bloques = list(iter_encuesta_chunks(path, df_puntajes, chunk_size, sheet_name))
+    filtradas = bloques[0].attrs['filtradas']
+
+    # Unir columna a columna: concat convertiría a object las categóricas con categorías distintas
+    columnas = {}
+    for columna, dtype in bloques[0].dtypes.items():
+        if isinstance(dtype, pd.CategoricalDtype):
+            serie = pd.api.types.union_categoricals([b[columna] for b in bloques])
+        else:
+            serie = pd.concat([b[columna] for b in bloques], ignore_index=True)
+        if columna in filtradas:
+            if not serie.notna().any():
+                continue
+            logger.info("Columna '%s' sin código de pregunta en el encabezado pero con respuestas puntuables",
+                        columna)
+        columnas[columna] = serie
+    return pd.DataFrame(columnas)
@@ -0,0 +1,314 @@
+"""Servidor local que imita el login de Microsoft y Microsoft Graph.
+
+Implementa solo las rutas que usan app.py y app_desktop.py (token, sitios,
+drives, metadatos y contenido de archivos, subida, /delta y $batch) sobre un
+directorio local, con latencia y throttling (429) configurables.
+
+Uso:
+    python fake_graph_server.py --data-dir fake_sharepoint --empresas 500
+    GRAPH_BASE_URL=http://localhost:8095/v1.0 LOGIN_BASE_URL=http://localhost:8095 python app.py
+"""
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qs, unquote
+
+from flask import Flask, Response, jsonify, request
+
+import sample_data
+
+SITE_ID = "localhost,00000000-0000-0000-0000-000000000001,00000000-0000-0000-0000-000000000002"
+DRIVES = [
+    {'id': 'drive-assets', 'name': 'Site Assets', 'driveType': 'documentLibrary'},
+    {'id': 'drive-documents', 'name': 'Documents', 'driveType': 'documentLibrary'},
+]
+DEFAULT_DRIVE = 'drive-documents'
+
+app = Flask(__name__)
+app.config.update(
+    DATA_DIR=os.path.join(os.getcwd(), "fake_sharepoint"),
+    LATENCY=0.0,
+    JITTER=0.0,
+    THROTTLE_RATE=0.0,
+    RETRY_AFTER=1,
+)
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def _error(status, code, message, headers=None):
+    return status, {'error': {'code': code, 'message': message}}, headers or {}
+
+
+def _local_path(drive_id, item_path):
+    if drive_id != DEFAULT_DRIVE:
+        return None
+    item_path = unquote(item_path).strip('/')
+    path = os.path.normpath(os.path.join(app.config['DATA_DIR'], item_path))
+    if not path.startswith(os.path.normpath(app.config['DATA_DIR'])):
+        return None
+    return path
+
+
+def _item_id(path):
+    relative = os.path.relpath(path, app.config['DATA_DIR']).replace(os.sep, '/')
+    return hashlib.sha1(relative.encode('utf-8')).hexdigest()[:16]
+
+
+def _find_item(item_id):
+    for root, _, files in os.walk(app.config['DATA_DIR']):
+        for name in files:
+            path = os.path.join(root, name)
+            if _item_id(path) == item_id:
+                return path
+    return None
+
+
+def _item_metadata(path):
+    stat = os.stat(path)
+    version = hashlib.sha1(f"{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:12]
+    item_id = _item_id(path)
+    return {
+        'id': item_id,
+        'name': os.path.basename(path),
+        'eTag': f'"{{{version}}},1"',
+        'size': stat.st_size,
+        'lastModifiedDateTime': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(stat.st_mtime)),
+        'parentReference': {'driveId': DEFAULT_DRIVE, 'siteId': SITE_ID},
+        'file': {},
+        '@microsoft.graph.downloadUrl': f"{request.host_url}download/{item_id}",
+    }
+
+
+def _drive_item(method, drive_id, item_path, content, body=None):
+    """Metadatos, descarga o subida de un archivo del drive"""
+    path = _local_path(drive_id, item_path)
+    if path is None:
+        return _error(404, 'itemNotFound', f"Drive '{drive_id}' o ruta no válida")
+
+    if content and method == 'PUT':
+        _count('upload')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(body or b'')
+        return 201, _item_metadata(path), {}
+
+    if not os.path.isfile(path):
+        return _error(404, 'itemNotFound', f"No existe el archivo '{item_path}'")
+
+    if content:
+        _count('content')
+        with open(path, 'rb') as f:
+            return 200, f.read(), {}
+
+    _count('item')
+    return 200, _item_metadata(path), {}
+
+
+def _delta(drive_id, token):
+    """Elementos modificados desde ``token`` (marca de tiempo en ns)"""
+    _count('delta')
+    if drive_id != DEFAULT_DRIVE:
+        return _error(404, 'itemNotFound', f"Drive '{drive_id}' no encontrado")
+    ahora = time.time_ns()
+    if token == 'latest':
+        desde = ahora
+    else:
+        try:
+            desde = int(token or 0)
+        except ValueError:
+            return _error(410, 'resyncRequired', 'Token de delta no válido')
+    cambios = []
+    for root, _, files in os.walk(app.config['DATA_DIR']):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.stat(path).st_mtime_ns > desde:
+                cambios.append(_item_metadata(path))
+    return 200, {
+        'value': cambios,
+        '@odata.deltaLink': f"{request.host_url}v1.0/drives/{drive_id}/root/delta?token={ahora}"
+    }, {}
+
+
+def handle(method, path, body=None):
+    """Resolver una ruta de Graph (relativa a /v1.0). Devuelve (status, body, headers)"""
+    path, _, query = path.partition('?')
+    path = path.strip('/')
+
+    if path.startswith('sites/'):
+        parts = path[len('sites/'):].split(':/')
+        if len(parts) >= 2 and parts[1].startswith('sites/'):
+            # Direccionamiento por ruta: sites/{host}:/sites/{nombre}[:/...]
+            extra = parts[2:]
+            if not extra:
+                _count('site')
+                return 200, {'id': SITE_ID, 'name': parts[1].split('/')[-1], 'webUrl': f"https://{parts[0]}/{parts[1]}"}, {}
+            if extra == ['drives']:
+                _count('drives')
+                return 200, {'value': DRIVES}, {}
+            if extra[0] == 'drive' and len(extra) == 1:
+                _count('drive')
+                return 200, DRIVES[1], {}
+            if extra[0] == 'drive/root' and len(extra) >= 2:
+                return _drive_item(method, DEFAULT_DRIVE, extra[1], content=extra[2:] == ['content'], body=body)
+            return _error(400, 'invalidRequest', f"Ruta no soportada: {path}")
+
+        # Direccionamiento por ID: sites/{site-id}/drives[/{drive-id}/root:/{ruta}:/content]
+        site_id, _, resto = parts[0].partition('/')
+        if site_id != SITE_ID:
+            return _error(404, 'itemNotFound', f"Sitio '{site_id}' no encontrado")
+        if resto == 'drives' and len(parts) == 1:
+            _count('drives')
+            return 200, {'value': DRIVES}, {}
+        if resto.startswith('drives/') and resto.endswith('/root') and len(parts) >= 2:
+            drive_id = resto[len('drives/'):-len('/root')]
+            return _drive_item(method, drive_id, parts[1], content=parts[2:] == ['content'], body=body)
+        return _error(400, 'invalidRequest', f"Ruta no soportada: {path}")
+
+    if path.startswith('drives/'):
+        parts = path.split(':/')
+        drive_id, _, resto = parts[0][len('drives/'):].partition('/')
+        if resto == 'root' and len(parts) >= 2:
+            return _drive_item(method, drive_id, parts[1], content=parts[2:] == ['content'], body=body)
+        if resto == 'root/delta' and len(parts) == 1:
+            return _delta(drive_id, parse_qs(query).get('token', [None])[0])
+        if resto.startswith('items/') and resto.endswith('/content'):
+            item_path = _find_item(resto.split('/')[1])
+            if item_path is None:
+                return _error(404, 'itemNotFound', "Elemento no encontrado")
+            return _drive_item(method, drive_id, os.path.relpath(item_path, app.config['DATA_DIR']), content=True)
+        return _error(400, 'invalidRequest', f"Ruta no soportada: {path}")
+
+    return _error(400, 'invalidRequest', f"Ruta no soportada: {path}")
+
+
+def _throttled():
+    """Decidir si se simula throttling para esta petición"""
+    return random.random() < app.config['THROTTLE_RATE']
+
+
+def _throttle_response():
+    return 429, {'error': {'code': 'TooManyRequests', 'message': 'Throttled (simulado)'}}, {
+        'Retry-After': str(app.config['RETRY_AFTER'])
+    }
+
+
+def _to_response(status, body, headers):
+    if isinstance(body, bytes):
+        response = Response(body, status=status, mimetype='application/octet-stream')
+    else:
+        response = jsonify(body)
+        response.status_code = status
+    for key, value in headers.items():
+        response.headers[key] = value
+    return response
+
+
+@app.before_request
+def inject_latency():
+    _count('requests')
+    delay = app.config['LATENCY'] + random.uniform(0, app.config['JITTER'])
+    if delay:
+        time.sleep(delay)
+
+
+@app.route('/<tenant_id>/oauth2/v2.0/token', methods=['POST'])
+def token(tenant_id):
+    _count('token')
+    if _throttled():
+        return _to_response(*_throttle_response())
+    if request.form.get('grant_type') != 'client_credentials':
+        return jsonify({'error': 'unsupported_grant_type'}), 400
+    return jsonify({
+        'token_type': 'Bearer',
+        'expires_in': 3599,
+        'access_token': f"fake-token-{tenant_id}-{int(time.time())}"
+    })
+
+
+@app.route('/v1.0/$batch', methods=['POST'])
+def batch():
+    _count('batch')
+    if not request.headers.get('Authorization', '').startswith('Bearer '):
+        return _to_response(*_error(401, 'InvalidAuthenticationToken', 'Falta el token'))
+    if _throttled():
+        return _to_response(*_throttle_response())
+    peticiones = (request.get_json(silent=True) or {}).get('requests', [])
+    if len(peticiones) > 20:
+        return _to_response(*_error(400, 'BadRequest', 'Un $batch admite como máximo 20 peticiones'))
+    respuestas = []
+    for peticion in peticiones:
+        if _throttled():
+            status, body, headers = _throttle_response()
+        else:
+            status, body, headers = handle(peticion.get('method', 'GET'), peticion['url'])
+        respuestas.append({'id': peticion['id'], 'status': status, 'headers': headers, 'body': body})
+    return jsonify({'responses': respuestas})
+
+
+@app.route('/v1.0/<path:graph_path>', methods=['GET', 'PUT'])
+def graph(graph_path):
+    if not request.headers.get('Authorization', '').startswith('Bearer '):
+        return _to_response(*_error(401, 'InvalidAuthenticationToken', 'Falta el token'))
+    if _throttled():
+        return _to_response(*_throttle_response())
+    path = f"{graph_path}?{request.query_string.decode()}" if request.query_string else graph_path
+    return _to_response(*handle(request.method, path, request.get_data()))
+
+
+@app.route('/download/<item_id>', methods=['GET'])
+def download(item_id):
+    _count('download')
+    path = _find_item(item_id)
+    if path is None:
+        return jsonify({'error': 'not found'}), 404
+    with open(path, 'rb') as f:
+        return Response(f.read(), mimetype='application/octet-stream')
+
+
+@app.route('/_stats', methods=['GET', 'DELETE'])
+def stats():
+    """Contadores de peticiones por tipo (DELETE los reinicia)"""
+    with _stats_lock:
+        if request.method == 'DELETE':
+            _stats.clear()
+        return jsonify(dict(_stats))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Servidor local de Microsoft Graph/SharePoint para pruebas")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8095)
+    parser.add_argument('--data-dir', default=app.config['DATA_DIR'],
+                        help="Directorio que hace de raíz del drive 'Documents'")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Latencia fija por petición")
+    parser.add_argument('--jitter-ms', type=float, default=0, help="Latencia aleatoria adicional máxima")
+    parser.add_argument('--throttle-rate', type=float, default=0,
+                        help="Probabilidad (0-1) de responder 429 a una petición")
+    parser.add_argument('--retry-after', type=int, default=1, help="Valor de Retry-After en los 429")
+    parser.add_argument('--empresas', type=int, default=200,
+                        help="Empresas de los datos sintéticos si el directorio está vacío")
+    args = parser.parse_args()
+
+    app.config.update(
+        DATA_DIR=os.path.abspath(args.data_dir),
+        LATENCY=args.latency_ms / 1000,
+        JITTER=args.jitter_ms / 1000,
+        THROTTLE_RATE=args.throttle_rate,
+        RETRY_AFTER=args.retry_after,
+    )
+    if not os.path.exists(os.path.join(app.config['DATA_DIR'], sample_data.ENCUESTA_FILENAME)):
+        for path in sample_data.write_fixtures(app.config['DATA_DIR'], n_empresas=args.empresas):
+            print(f"Archivo generado: {path}")
+
+    app.run(host=args.host, port=args.port, threaded=True)
@@ -0,0 +1,353 @@
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import quote
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# URLs base; se pueden cambiar (p. ej. al servidor local fake_graph_server.py)
+GRAPH_URL = "https://graph.microsoft.com/v1.0"
+LOGIN_URL = "https://login.microsoftonline.com"
+
+# Códigos que indican un error transitorio (throttling o caída del servicio)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Límite de peticiones por llamada a /$batch impuesto por Graph
+BATCH_LIMIT = 20
+
+# Campos de metadatos que se piden para cada archivo
+ITEM_FIELDS = "id,name,eTag,size,parentReference,@microsoft.graph.downloadUrl"
+
+
+class DeltaResyncRequired(Exception):
+    """Graph invalidó el token de /delta (410 Gone): hay que volver a sincronizar"""
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: Graph falló demasiadas veces seguidas"""
+
+
+class CircuitBreaker:
+    """Circuit breaker por fallos consecutivos.
+
+    Tras ``failure_threshold`` fallos seguidos se abre durante
+    ``reset_timeout`` segundos; pasado ese tiempo deja pasar una sola
+    petición de prueba (medio abierto) que lo cierra o lo vuelve a abrir.
+    Solo son fallos los errores de red, timeouts y 5xx: un 429 indica que
+    Graph responde y se resuelve esperando lo que pide ``Retry-After``.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self._trial_in_flight:
+                raise CircuitOpenError(
+                    f"Microsoft Graph no disponible temporalmente; reintente en {max(remaining, 0):.0f}s"
+                )
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_throttled(self):
+        """429: no es un fallo ni un éxito, pero libera la petición de prueba"""
+        with self._lock:
+            if self._trial_in_flight:
+                # Graph respondió: se cierra el circuito
+                self._opened_at = None
+                self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class GraphClient:
+    """Capa HTTP para el login de Microsoft y Microsoft Graph.
+
+    Todas las peticiones llevan timeout de conexión y de lectura, se
+    reintentan con backoff exponencial con jitter ante 429/5xx y errores de
+    red (respetando ``Retry-After``) y pasan por un circuit breaker
+    compartido, que no cuenta los 429 (el throttling se resuelve esperando,
+    no cortando todas las peticiones). Es seguro usar una misma instancia
+    desde varios hilos.
+    """
+
+    def __init__(self, connect_timeout=5.0, read_timeout=60.0, max_retries=4,
+                 backoff_base=0.5, backoff_max=30.0, breaker=None, session=None,
+                 graph_url=GRAPH_URL, login_url=LOGIN_URL):
+        self.graph_url = (graph_url or GRAPH_URL).rstrip('/')
+        self.login_url = (login_url or LOGIN_URL).rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self.session = session or requests.Session()
+
+    @classmethod
+    def from_env(cls):
+        """Crear el cliente con la configuración de las variables de entorno"""
+        return cls(
+            connect_timeout=float(os.getenv("GRAPH_CONNECT_TIMEOUT", "5")),
+            read_timeout=float(os.getenv("GRAPH_READ_TIMEOUT", "60")),
+            max_retries=int(os.getenv("GRAPH_MAX_RETRIES", "4")),
+            graph_url=os.getenv("GRAPH_BASE_URL", GRAPH_URL),
+            login_url=os.getenv("LOGIN_BASE_URL", LOGIN_URL),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("GRAPH_BREAKER_THRESHOLD", "5")),
+                reset_timeout=float(os.getenv("GRAPH_BREAKER_RESET", "30")),
+            ),
+        )
+
+    def token_url(self, tenant_id):
+        """URL del endpoint de tokens (Client Credentials) del tenant"""
+        return f"{self.login_url}/{tenant_id}/oauth2/v2.0/token"
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def put(self, url, **kwargs):
+        return self.request('PUT', url, **kwargs)
+
+    def request(self, method, url, **kwargs):
+        """Enviar la petición con reintentos.
+
+        Si se agotan los reintentos ante un 429/5xx (o ``Retry-After`` pide
+        esperar más de ``backoff_max``) se devuelve la última respuesta para
+        que ``raise_for_status`` del llamador informe el error.
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._backoff(attempt))
+                attempt += 1
+                continue
+            except Exception:
+                # Cualquier otro error también cuenta (y libera la prueba en medio abierto)
+                self.breaker.record_failure()
+                raise
+
+            if response.status_code not in RETRY_STATUS:
+                self.breaker.record_success()
+                return response
+
+            if response.status_code == 429:
+                self.breaker.record_throttled()
+            else:
+                self.breaker.record_failure()
+            if attempt >= self.max_retries:
+                return response
+            delay = self._retry_after(response)
+            if delay is None:
+                delay = self._backoff(attempt)
+            elif delay > self.backoff_max:
+                # Esperar más de lo permitido alargaría la petición sin límite
+                return response
+            logger.warning("%s %s devolvió %s; reintento %d en %.1fs",
+                           method, url, response.status_code, attempt + 1, delay,
+                           extra={'status': response.status_code, 'intento': attempt + 1})
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _backoff(self, attempt):
+        """Backoff exponencial con jitter completo"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_after(self, response):
+        """Segundos indicados por la cabecera Retry-After (número o fecha HTTP)"""
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                seconds = parsedate_to_datetime(value).timestamp() - time.time()
+            except (TypeError, ValueError):
+                return None
+        # Pequeño jitter para que los hilos no reintenten todos a la vez
+        return max(seconds, 0) + random.uniform(0, self.backoff_base)
+
+    def batch(self, access_token, batch_requests):
+        """Enviar peticiones GET independientes agrupadas en llamadas a ``/$batch``.
+
+        ``batch_requests`` es un diccionario ``{id (str): url relativa}``. Devuelve
+        ``{id: respuesta}`` con el ``status`` y el ``body`` de cada petición.
+        Las respuestas internas con 429/5xx se reenvían en un nuevo lote.
+        """
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        pending = dict(batch_requests)
+        results = {}
+        attempt = 0
+        while pending:
+            ids = list(pending)
+            delays = []
+            for start in range(0, len(ids), BATCH_LIMIT):
+                chunk = ids[start:start + BATCH_LIMIT]
+                payload = {'requests': [{'id': i, 'method': 'GET', 'url': pending[i]} for i in chunk]}
+                response = self.post(f"{self.graph_url}/$batch", headers=headers, json=payload)
+                response.raise_for_status()
+                for item in response.json().get('responses', []):
+                    request_id = item['id']
+                    results[request_id] = item
+                    if item.get('status') not in RETRY_STATUS:
+                        del pending[request_id]
+                        continue
+                    retry_after = (item.get('headers') or {}).get('Retry-After')
+                    if retry_after and retry_after.isdigit():
+                        delays.append(float(retry_after))
+
+            if not pending:
+                break
+            if attempt >= self.max_retries:
+                break
+            delay = max(delays) if delays else self._backoff(attempt)
+            if delay > self.backoff_max:
+                break
+            logger.warning("$batch: %d peticiones a reintentar en %.1fs", len(pending), delay)
+            time.sleep(delay)
+            attempt += 1
+
+        return results
+
+    def resolve_site(self, access_token, site_url, file_paths):
+        """Resolver sitio, drive y metadatos de archivos con el mínimo de viajes.
+
+        En un solo ``$batch`` se piden el sitio, sus drives y los metadatos de
+        cada archivo en el drive por defecto. Si el drive elegido no es el
+        drive por defecto, los archivos se vuelven a pedir en un segundo lote.
+        Devuelve ``{'site_id', 'drive_id', 'items': {ruta: metadatos o None}}``.
+        """
+        site_ref = f"/sites/{quote(site_url, safe=':/')}"
+        batch_requests = {'site': site_ref, 'drives': f"{site_ref}:/drives"}
+        for index, path in enumerate(file_paths):
+            batch_requests[f'item{index}'] = f"{site_ref}:/drive/root:/{_item_path(path)}?$select={ITEM_FIELDS}"
+
+        results = self.batch(access_token, batch_requests)
+        site_id = _batch_body(results['site'], 'sitio')['id']
+        drive_id = select_drive(_batch_body(results['drives'], 'drives'))
+
+        items = {}
+        missing = {}
+        for index, path in enumerate(file_paths):
+            result = results[f'item{index}']
+            body = result.get('body') or {}
+            if result.get('status') == 200 and body.get('parentReference', {}).get('driveId') == drive_id:
+                items[path] = body
+            else:
+                missing[f'item{index}'] = path
+
+        if missing:
+            # El drive elegido no es el por defecto o la ruta no se pudo resolver
+            retry = self.batch(access_token, {
+                key: f"/drives/{drive_id}/root:/{_item_path(path)}?$select={ITEM_FIELDS}"
+                for key, path in missing.items()
+            })
+            for key, path in missing.items():
+                result = retry[key]
+                if result.get('status') == 404:
+                    items[path] = None
+                else:
+                    items[path] = _batch_body(result, path)
+
+        logger.debug("Site ID: %s, Drive ID: %s", site_id, drive_id)
+        return {'site_id': site_id, 'drive_id': drive_id, 'items': items}
+
+    def delta(self, access_token, drive_id, delta_link=None):
+        """Cambios del drive desde ``delta_link`` usando ``/root/delta``.
+
+        Solo se leen metadatos, nunca contenido. Sin ``delta_link`` se pide
+        ``token=latest``: no devuelve elementos, solo el punto de partida.
+        Devuelve ``(elementos_cambiados, nuevo_delta_link)``.
+        """
+        headers = {
+            'Authorization': f'Bearer {access_token}',
+            'Accept': 'application/json'
+        }
+        if delta_link:
+            url = delta_link
+        else:
+            url = f"{self.graph_url}/drives/{drive_id}/root/delta?token=latest"
+
+        items = []
+        while True:
+            response = self.get(url, headers=headers)
+            if response.status_code == 410:
+                raise DeltaResyncRequired("El token de /delta expiró; se requiere resincronizar")
+            response.raise_for_status()
+            data = response.json()
+            items.extend(data.get('value', []))
+            if '@odata.nextLink' in data:
+                url = data['@odata.nextLink']
+                continue
+            return items, data['@odata.deltaLink']
+
+
+def select_drive(drives_data):
+    """Elegir el drive principal (Documents) o el primero disponible"""
+    drive_id = None
+    for drive in drives_data.get('value', []):
+        if drive.get('name') == 'Documents' or 'document' in drive.get('name', '').lower():
+            drive_id = drive['id']
+            break
+
+    if not drive_id and drives_data.get('value'):
+        # Si no encontramos el drive de Documents, usar el primero disponible
+        drive_id = drives_data['value'][0]['id']
+
+    if not drive_id:
+        raise Exception("No se pudo encontrar un drive válido en el sitio de SharePoint")
+
+    return drive_id
+
+
+def _item_path(file_path):
+    """Ruta del archivo relativa a la raíz del drive, codificada para la URL"""
+    # "Documentos compartidos/" es parte del drive, no de la ruta
+    return quote(file_path.replace('Documentos compartidos/', ''), safe='/')
+
+
+def _batch_body(result, descripcion):
+    """Devolver el body de una respuesta de $batch o lanzar un HTTPError"""
+    status = result.get('status')
+    if status is None or status >= 400:
+        error = (result.get('body') or {}).get('error', {})
+        raise requests.HTTPError(f"Error {status} obteniendo {descripcion}: {error.get('message', '')}")
+    return result['body']
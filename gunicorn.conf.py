@@ -0,0 +1,46 @@
+"""Configuración de gunicorn para wsgi:app.
+
+Cada worker es un proceso con su propia sesión de Graph, token, tabla de
+puntajes compilada e índice de consultas; se precalientan en
+``post_worker_init``. Con WATCH_ENABLED=true el watcher corre en un solo
+worker (el que obtiene el bloqueo de WATCH_LOCK_FILE) y los demás recogen
+las ejecuciones nuevas del histórico. Las generaciones de distintos workers
+se ejecutan de una en una (bloqueo de GENERATION_LOCK_FILE, en app.py).
+"""
+import fcntl
+import os
+import tempfile
+
+bind = f"{os.getenv('WEB_HOST', '0.0.0.0')}:{os.getenv('WEB_PORT', '8090')}"
+workers = int(os.getenv("WEB_WORKERS", "2"))
+threads = int(os.getenv("WEB_THREADS", "8"))
+worker_class = "gthread"
+# /generate-excel descarga, puntúa y sube el informe: puede tardar minutos
+timeout = int(os.getenv("WEB_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+
+WATCH_LOCK_FILE = os.getenv("WATCH_LOCK_FILE", os.path.join(tempfile.gettempdir(), "sharepoint-watcher.lock"))
+_watch_lock = None
+
+
+def _acquire_watch_lock():
+    """Bloqueo exclusivo sin espera; el sistema lo libera si el worker muere"""
+    global _watch_lock
+    lock = open(WATCH_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock.close()
+        return False
+    _watch_lock = lock
+    return True
+
+
+def post_worker_init(worker):
+    import app as servicio
+
+    servicio.warm_up()
+    if servicio.WATCH_ENABLED and _acquire_watch_lock():
+        worker.log.info("Watcher de SharePoint activo en el worker %s", worker.pid)
+        servicio.start_watcher()
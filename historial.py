@@ -0,0 +1,222 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+# Columnas de las tablas de resultados -> columnas en SQLite
+COLUMNAS = {
+    'resultados': {
+        'ID': 'id_empresa', 'Empresa': 'empresa', 'Tamaño': 'tamano', 'Pais': 'pais',
+        'Seccion': 'seccion', 'Tamaño de empresa': 'tamano_empresa',
+        'Puntaje': 'puntaje', 'Puntaje Seccion': 'puntaje_seccion',
+    },
+    'totales': {
+        'ID': 'id_empresa', 'Empresa': 'empresa', 'Puntaje': 'puntaje',
+        'Puntaje Seccion': 'puntaje_seccion', 'Porcentaje Total': 'porcentaje_total',
+    },
+    'paises': {
+        'Pais': 'pais', 'Seccion': 'seccion', 'Puntaje': 'puntaje', 'Puntaje Seccion': 'puntaje_seccion',
+    },
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS ejecuciones (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    fecha TEXT NOT NULL,
+    encuesta_hash TEXT,
+    puntajes_hash TEXT,
+    origen TEXT,
+    empresas INTEGER,
+    resultados INTEGER
+);
+CREATE INDEX IF NOT EXISTS ix_ejecuciones_fecha ON ejecuciones (fecha);
+CREATE INDEX IF NOT EXISTS ix_ejecuciones_hash ON ejecuciones (encuesta_hash, puntajes_hash);
+
+CREATE TABLE IF NOT EXISTS resultados (
+    run_id INTEGER NOT NULL REFERENCES ejecuciones (run_id),
+    id_empresa, empresa TEXT, tamano TEXT, pais TEXT, seccion TEXT, tamano_empresa TEXT,
+    puntaje REAL, puntaje_seccion REAL
+);
+CREATE INDEX IF NOT EXISTS ix_resultados_run ON resultados (run_id);
+CREATE INDEX IF NOT EXISTS ix_resultados_empresa ON resultados (id_empresa, run_id);
+CREATE INDEX IF NOT EXISTS ix_resultados_pais ON resultados (pais, seccion, run_id);
+CREATE INDEX IF NOT EXISTS ix_resultados_seccion ON resultados (seccion, run_id);
+
+CREATE TABLE IF NOT EXISTS totales (
+    run_id INTEGER NOT NULL REFERENCES ejecuciones (run_id),
+    id_empresa, empresa TEXT, puntaje REAL, puntaje_seccion REAL, porcentaje_total REAL
+);
+CREATE INDEX IF NOT EXISTS ix_totales_run ON totales (run_id);
+CREATE INDEX IF NOT EXISTS ix_totales_empresa ON totales (id_empresa, run_id);
+
+CREATE TABLE IF NOT EXISTS paises (
+    run_id INTEGER NOT NULL REFERENCES ejecuciones (run_id),
+    pais TEXT, seccion TEXT, puntaje REAL, puntaje_seccion REAL
+);
+CREATE INDEX IF NOT EXISTS ix_paises_run ON paises (run_id);
+CREATE INDEX IF NOT EXISTS ix_paises_pais ON paises (pais, seccion, run_id);
+"""
+
+
+def file_sha256(path):
+    """Hash SHA-256 del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _id_params(id_empresa):
+    """El ID puede venir como texto (URL) y estar guardado como número, o al revés"""
+    texto = str(id_empresa).strip()
+    try:
+        numero = int(texto)
+    except ValueError:
+        return texto, texto
+    return texto, numero
+
+
+class ResultsStore:
+    """Histórico local de ejecuciones en SQLite.
+
+    Cada ejecución guarda una instantánea de las tres tablas de resultados
+    etiquetada con la fecha y el hash de los archivos de entrada, de modo que
+    las series por empresa o por país son consultas indexadas en lugar de
+    volver a descargar y puntuar exportaciones antiguas.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directorio = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directorio):
+            os.makedirs(directorio)
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(ESQUEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Una conexión por operación: el servicio Flask atiende en varios hilos"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save_run(self, tablas, encuesta_hash=None, puntajes_hash=None, origen=None):
+        """Guardar la instantánea de una ejecución y devolver su ``run_id``.
+
+        Si la última ejecución tiene los mismos hashes de entrada no se
+        duplica: se devuelve su ``run_id``. Así la última ejecución es siempre
+        la de los resultados vigentes, aunque se vuelva a unas entradas antiguas.
+
+        La fila de ``ejecuciones`` y las tres tablas se escriben en una sola
+        transacción: otra conexión (otro worker) ve la ejecución completa o no
+        la ve. ``to_sql`` no sirve aquí porque confirma cada tabla por separado.
+        """
+        with self._write_lock, self._connect() as conn:
+            if encuesta_hash and puntajes_hash:
+                ultima = conn.execute(
+                    "SELECT run_id, encuesta_hash, puntajes_hash FROM ejecuciones ORDER BY run_id DESC LIMIT 1"
+                ).fetchone()
+                if ultima and (ultima['encuesta_hash'], ultima['puntajes_hash']) == (encuesta_hash, puntajes_hash):
+                    return ultima['run_id']
+
+            cursor = conn.execute(
+                "INSERT INTO ejecuciones (fecha, encuesta_hash, puntajes_hash, origen, empresas, resultados) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), encuesta_hash, puntajes_hash, origen,
+                 len(tablas['totales']), len(tablas['resultados']))
+            )
+            run_id = cursor.lastrowid
+            for tabla, columnas in COLUMNAS.items():
+                df = tablas[tabla]
+                # tolist() convierte los escalares de numpy a tipos de Python que sqlite3 acepta
+                valores = [df[columna].tolist() for columna in columnas]
+                conn.executemany(
+                    f"INSERT INTO {tabla} (run_id, {', '.join(columnas.values())}) "
+                    f"VALUES (?{', ?' * len(columnas)})",
+                    ((run_id, *fila) for fila in zip(*valores))
+                )
+            return run_id
+
+    def list_runs(self, limit=100):
+        """Ejecuciones guardadas, de la más reciente a la más antigua"""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT * FROM ejecuciones ORDER BY run_id DESC LIMIT ?", conn, params=(limit,)
+            )
+
+    def latest_run_id(self):
+        with self._connect() as conn:
+            fila = conn.execute("SELECT MAX(run_id) AS run_id FROM ejecuciones").fetchone()
+            return fila['run_id']
+
+    def load_run(self, run_id=None):
+        """Reconstruir las tablas de una ejecución (por defecto la última) o None"""
+        run_id = run_id or self.latest_run_id()
+        if run_id is None:
+            return None
+        tablas = {}
+        with self._connect() as conn:
+            for tabla, columnas in COLUMNAS.items():
+                df = pd.read_sql_query(
+                    f"SELECT {', '.join(columnas.values())} FROM {tabla} WHERE run_id = ? ORDER BY rowid",
+                    conn, params=(run_id,)
+                )
+                tablas[tabla] = df.rename(columns={v: k for k, v in columnas.items()})
+        return tablas
+
+    def company_history(self, id_empresa):
+        """Porcentaje total de una empresa en cada ejecución"""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT e.run_id, e.fecha, t.id_empresa AS ID, t.empresa AS Empresa, "
+                "t.puntaje AS Puntaje, t.puntaje_seccion AS \"Puntaje Seccion\", "
+                "t.porcentaje_total AS \"Porcentaje Total\" "
+                "FROM totales t JOIN ejecuciones e ON e.run_id = t.run_id "
+                "WHERE t.id_empresa IN (?, ?) ORDER BY e.run_id",
+                conn, params=_id_params(id_empresa)
+            )
+
+    def company_sections_history(self, id_empresa, seccion=None):
+        """Puntaje por sección de una empresa en cada ejecución"""
+        consulta = (
+            "SELECT e.run_id, e.fecha, r.seccion AS Seccion, SUM(r.puntaje) AS Puntaje, "
+            "SUM(r.puntaje_seccion) AS \"Puntaje Seccion\" "
+            "FROM resultados r JOIN ejecuciones e ON e.run_id = r.run_id "
+            "WHERE r.id_empresa IN (?, ?)"
+        )
+        params = list(_id_params(id_empresa))
+        if seccion:
+            consulta += " AND r.seccion = ?"
+            params.append(seccion)
+        consulta += " GROUP BY e.run_id, r.seccion ORDER BY e.run_id, r.seccion"
+        with self._connect() as conn:
+            return pd.read_sql_query(consulta, conn, params=params)
+
+    def country_history(self, pais=None, seccion=None):
+        """Hoja 'General por paises' de cada ejecución, filtrada por país y/o sección"""
+        consulta = (
+            "SELECT e.run_id, e.fecha, p.pais AS Pais, p.seccion AS Seccion, p.puntaje AS Puntaje, "
+            "p.puntaje_seccion AS \"Puntaje Seccion\" "
+            "FROM paises p JOIN ejecuciones e ON e.run_id = p.run_id WHERE 1 = 1"
+        )
+        params = []
+        if pais:
+            consulta += " AND p.pais = ?"
+            params.append(pais)
+        if seccion:
+            consulta += " AND p.seccion = ?"
+            params.append(seccion)
+        consulta += " ORDER BY e.run_id, p.pais, p.seccion"
+        with self._connect() as conn:
+            return pd.read_sql_query(consulta, conn, params=params)
@@ -0,0 +1,88 @@
+"""Prueba de carga de /generate-excel.
+
+Lanza peticiones concurrentes contra el servicio Flask (normalmente
+apuntando a fake_graph_server.py) e informa throughput y latencias p50,
+p95 y p99.
+
+Uso:
+    python load_test.py --url http://localhost:8090/generate-excel --requests 50 --concurrency 8
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(values, pct):
+    """Percentil con interpolación lineal (values ordenados)"""
+    if not values:
+        return float('nan')
+    rank = (len(values) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (rank - lower)
+
+
+def run(url, total, concurrency, timeout):
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    def one(_):
+        start = time.perf_counter()
+        try:
+            response = session.get(url, timeout=timeout)
+            ok = response.status_code == 200
+            detail = None if ok else f"{response.status_code}: {response.text[:200]}"
+        except requests.RequestException as e:
+            ok, detail = False, str(e)
+        return time.perf_counter() - start, ok, detail
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, ok, _ in results if ok)
+    errors = [detail for _, ok, detail in results if not ok]
+    return {
+        'requests': total,
+        'concurrency': concurrency,
+        'ok': len(latencies),
+        'errors': len(errors),
+        'elapsed_s': round(elapsed, 3),
+        # Solo cuentan las respuestas correctas: un error rápido no es rendimiento
+        'throughput_rps': round(len(latencies) / elapsed, 3) if elapsed else None,
+        'error_rate': round(len(errors) / total, 3) if total else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else None,
+        'sample_errors': errors[:5],
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prueba de carga de /generate-excel")
+    parser.add_argument('--url', default='http://localhost:8090/generate-excel')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--json', action='store_true', help="Imprimir el resultado como JSON")
+    args = parser.parse_args()
+
+    report = run(args.url, args.requests, args.concurrency, args.timeout)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"Peticiones: {report['requests']} (concurrencia {report['concurrency']}), "
+              f"OK: {report['ok']}, errores: {report['errors']}")
+        print(f"Duración: {report['elapsed_s']} s, throughput: {report['throughput_rps']} req/s correctas, "
+              f"tasa de error: {report['error_rate']:.1%}")
+        print(f"Latencia p50: {report['p50_ms']} ms, p95: {report['p95_ms']} ms, "
+              f"p99: {report['p99_ms']} ms, máx: {report['max_ms']} ms")
+        for error in report['sample_errors']:
+            print(f"  Error: {error}")
@@ -0,0 +1,91 @@
+"""Registro (logging) común para app.py, app_desktop.py y los módulos de apoyo.
+
+Cada módulo usa ``logging.getLogger(__name__)`` con formato diferido
+(``logger.debug("Archivo %s", ruta)``): si el nivel está desactivado el
+mensaje ni siquiera se construye. ``configure_logging`` instala un único
+handler en texto o en JSON (una línea por registro) y cada generación de
+reporte lleva un ``correlation_id`` para seguirla en los registros aunque
+haya varias peticiones o el watcher en paralelo.
+
+Variables: LOG_LEVEL (DEBUG, INFO, WARNING...) y LOG_FORMAT (text o json).
+"""
+import contextvars
+import json
+import logging
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_correlation_id = contextvars.ContextVar('correlation_id', default=None)
+
+# Atributos propios de LogRecord; el resto viene de ``extra=`` y va al JSON
+_ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'correlation_id'}
+
+TEXT_FORMAT = "%(asctime)s %(levelname)-7s [%(correlation_id)s] %(name)s: %(message)s"
+
+
+class CorrelationFilter(logging.Filter):
+    """Añadir el correlation_id de la ejecución en curso a cada registro"""
+
+    def filter(self, record):
+        record.correlation_id = _correlation_id.get() or '-'
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea con los campos de ``extra=`` incluidos"""
+
+    def format(self, record):
+        datos = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'correlation_id': getattr(record, 'correlation_id', None),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_ESTANDAR and not clave.startswith('_'):
+                datos[clave] = valor
+        if record.exc_info:
+            datos['exc'] = self.formatException(record.exc_info)
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+def configure_logging(level=None, json_format=None):
+    """Configurar el logger raíz una sola vez por proceso (llamadas repetidas solo cambian el nivel)"""
+    level = level or os.getenv("LOG_LEVEL", "INFO")
+    if json_format is None:
+        json_format = os.getenv("LOG_FORMAT", "text").lower() == "json"
+
+    raiz = logging.getLogger()
+    raiz.setLevel(level.upper() if isinstance(level, str) else level)
+    if any(getattr(h, '_registro', False) for h in raiz.handlers):
+        return raiz
+
+    handler = logging.StreamHandler()
+    handler._registro = True
+    handler.addFilter(CorrelationFilter())
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+    raiz.addHandler(handler)
+    # Las conexiones de requests/urllib3 no aportan en DEBUG y lo inundan
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    return raiz
+
+
+def new_correlation_id():
+    return uuid.uuid4().hex[:12]
+
+
+def current_correlation_id():
+    return _correlation_id.get()
+
+
+@contextmanager
+def correlation_context(correlation_id=None):
+    """Asociar los registros del bloque (en este hilo o contexto) a una ejecución"""
+    token = _correlation_id.set(correlation_id or new_correlation_id())
+    try:
+        yield _correlation_id.get()
+    finally:
+        _correlation_id.reset(token)
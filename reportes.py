@@ -0,0 +1,218 @@
+"""Reportes individuales por empresa (un libro Excel o CSV por ID).
+
+Cada empresa recibe su propio archivo en una carpeta de SharePoint:
+``{carpeta base}/{ID} - {Empresa}/radar_{ID}.xlsx``. En la carpeta base se
+guarda un manifiesto (``_manifest.json``) con el hash del contenido de cada
+reporte, por formato; en la siguiente ejecución solo se generan y suben los
+que cambiaron, y alternar entre xlsx y csv no obliga a subirlos todos.
+
+El hash se calcula sobre los datos del reporte, no sobre los bytes del
+archivo: openpyxl escribe la fecha de creación dentro del .xlsx y dos libros
+con los mismos datos nunca son idénticos byte a byte.
+"""
+import hashlib
+import contextvars
+import json
+import logging
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from io import BytesIO
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+REPORTES_FOLDER = "Reportes por empresa"
+MANIFEST_FILENAME = "_manifest.json"
+CONTENT_TYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv; charset=utf-8',
+}
+# Por debajo de estos reportes pendientes no compensa arrancar procesos
+PARALLEL_MIN_REPORTS = 50
+UPLOAD_CONCURRENCY = 4
+
+# Caracteres no permitidos en nombres de carpeta de SharePoint
+INVALID_CHARS_RE = re.compile(r'["*:<>?/\\|#%~&{}]')
+
+
+def company_folder(id_empresa, empresa):
+    """Nombre de carpeta estable y válido para SharePoint: '12 - Empresa S.A'"""
+    nombre = INVALID_CHARS_RE.sub('', f"{id_empresa} - {empresa}").strip(' .')
+    return nombre[:120] or str(id_empresa)
+
+
+def company_tables(tablas):
+    """Hojas de cada empresa: detalle por sección (radar) y porcentaje total"""
+    detalle = tablas['resultados'].copy()
+    detalle['Porcentaje'] = detalle['Puntaje'] / detalle['Puntaje Seccion'].replace(0, float('nan'))
+    totales = tablas['totales'][['ID', 'Empresa', 'Puntaje', 'Puntaje Seccion', 'Porcentaje Total']]
+
+    totales_por_id = dict(tuple(totales.groupby('ID', sort=False)))
+    empresas = {}
+    for id_empresa, radar in detalle.groupby('ID', sort=False):
+        empresas[id_empresa] = {
+            'Radar': radar.reset_index(drop=True),
+            'General': totales_por_id.get(id_empresa, totales.iloc[0:0]).reset_index(drop=True),
+        }
+    return empresas
+
+
+def content_hash(hojas, formato):
+    """Hash de los datos del reporte (independiente de metadatos del archivo)"""
+    digest = hashlib.sha256(formato.encode())
+    for nombre, df in hojas.items():
+        digest.update(nombre.encode('utf-8'))
+        digest.update(df.to_csv(index=False).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_company_report(hojas, formato='xlsx'):
+    """Contenido del archivo de una empresa"""
+    if formato == 'csv':
+        # Una sola tabla: el detalle por sección con el porcentaje total de la empresa
+        radar = hojas['Radar']
+        if not hojas['General'].empty:
+            radar = radar.assign(**{'Porcentaje Total': hojas['General']['Porcentaje Total'].iloc[0]})
+        # utf-8-sig para que Excel muestre bien los acentos
+        return radar.to_csv(index=False).encode('utf-8-sig')
+
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for nombre, df in hojas.items():
+            df.to_excel(writer, sheet_name=nombre, index=False)
+    return output.getvalue()
+
+
+def _render_batch(lote, formato):
+    return [(id_empresa, render_company_report(hojas, formato)) for id_empresa, hojas in lote]
+
+
+def build_company_reports(tablas, formato='xlsx', manifiesto=None, workers=1, forzar=False):
+    """Generar los reportes que cambiaron respecto a ``manifiesto``.
+
+    Devuelve ``(reportes, manifiesto_nuevo, sin_cambios)``; cada reporte es un
+    diccionario con id, carpeta, archivo, hash y contenido. Con ``workers`` > 1
+    y suficientes reportes pendientes se generan en varios procesos.
+    """
+    if formato not in CONTENT_TYPES:
+        raise ValueError(f"Formato de reporte no soportado: '{formato}' (use xlsx o csv)")
+    manifiesto = manifiesto or {}
+    nuevo = {}
+    pendientes = []
+    sin_cambios = 0
+
+    for id_empresa, hojas in company_tables(tablas).items():
+        empresa = hojas['Radar']['Empresa'].iloc[0]
+        entrada = {
+            'carpeta': company_folder(id_empresa, empresa),
+            'archivo': f"radar_{id_empresa}.{formato}",
+            'hash': content_hash(hojas, formato),
+        }
+        clave = str(id_empresa)
+        nuevo[clave] = entrada
+        if not forzar and manifiesto.get(clave) == entrada:
+            sin_cambios += 1
+            continue
+        pendientes.append((id_empresa, hojas))
+
+    workers = workers or multiprocessing.cpu_count()
+    if workers <= 1 or len(pendientes) < PARALLEL_MIN_REPORTS:
+        contenidos = _render_batch(pendientes, formato)
+    else:
+        tamano_lote = max(1, len(pendientes) // (workers * 4))
+        lotes = [pendientes[i:i + tamano_lote] for i in range(0, len(pendientes), tamano_lote)]
+        contenidos = []
+        # 'spawn' como en scoring.compute_results_parallel
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for resultado in executor.map(_render_batch, lotes, [formato] * len(lotes)):
+                contenidos.extend(resultado)
+
+    reportes = [dict(nuevo[str(id_empresa)], id=id_empresa, contenido=contenido)
+                for id_empresa, contenido in contenidos]
+    return reportes, nuevo, sin_cambios
+
+
+def upload_company_reports(reportes, upload, base_folder=REPORTES_FOLDER, formato='xlsx',
+                           concurrency=UPLOAD_CONCURRENCY, progress_callback=None):
+    """Subir los reportes con como mucho ``concurrency`` subidas simultáneas.
+
+    ``upload(contenido, archivo, carpeta, content_type)`` hace la subida real
+    (app.py y app_desktop.py tienen cada uno la suya). Devuelve la lista de
+    errores ``{'id', 'archivo', 'error'}``; un fallo no detiene las demás.
+    """
+    errores = []
+    if not reportes:
+        return errores
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        # copy_context: los registros de cada subida conservan el correlation_id
+        futuros = {
+            executor.submit(contextvars.copy_context().run, upload, r['contenido'], r['archivo'],
+                            f"{base_folder}/{r['carpeta']}", CONTENT_TYPES[formato]): r
+            for r in reportes
+        }
+        for numero, futuro in enumerate(as_completed(futuros), start=1):
+            reporte = futuros[futuro]
+            try:
+                futuro.result()
+            except Exception as e:
+                logger.error("No se pudo subir %s: %s", reporte['archivo'], e)
+                errores.append({'id': reporte['id'], 'archivo': reporte['archivo'], 'error': str(e)})
+            if progress_callback:
+                progress_callback('empresas', numero, len(reportes))
+    finally:
+        # Si progress_callback cancela, no empezar las subidas pendientes
+        executor.shutdown(wait=True, cancel_futures=True)
+    return errores
+
+
+def load_manifest(graph, access_token, drive_id, base_folder=REPORTES_FOLDER):
+    """Manifiestos de las ejecuciones anteriores por formato: {formato: {id: entrada}} ({} si no existe)"""
+    url = f"{graph.graph_url}/drives/{drive_id}/root:/{base_folder}/{MANIFEST_FILENAME}:/content"
+    response = graph.get(url, headers={'Authorization': f'Bearer {access_token}'})
+    if response.status_code == 404:
+        return {}
+    response.raise_for_status()
+    datos = response.json()
+    if 'formatos' in datos:
+        return datos['formatos']
+    # Manifiesto anterior, de un solo formato
+    return {datos.get('formato', 'xlsx'): datos.get('empresas', {})}
+
+
+def manifest_content(manifiestos):
+    return json.dumps({'formatos': manifiestos}, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def publish_company_reports(tablas, graph, access_token, drive_id, upload, formato='xlsx',
+                            base_folder=REPORTES_FOLDER, workers=1, concurrency=UPLOAD_CONCURRENCY,
+                            forzar=False, progress_callback=None):
+    """Generar y subir los reportes por empresa que cambiaron y actualizar el manifiesto"""
+    manifiestos = load_manifest(graph, access_token, drive_id, base_folder)
+    manifiesto = {} if forzar else manifiestos.get(formato, {})
+    reportes, nuevo, sin_cambios = build_company_reports(tablas, formato, manifiesto, workers, forzar)
+    logger.info("Reportes por empresa: %d a subir, %d sin cambios", len(reportes), sin_cambios)
+
+    errores = upload_company_reports(reportes, upload, base_folder, formato, concurrency, progress_callback)
+    for error in errores:
+        # Lo que no se subió conserva la entrada anterior y se reintenta la próxima vez
+        clave = str(error['id'])
+        if clave in manifiesto:
+            nuevo[clave] = manifiesto[clave]
+        else:
+            nuevo.pop(clave, None)
+    if reportes:
+        # Se conservan las entradas de los otros formatos
+        manifiestos[formato] = nuevo
+        upload(manifest_content(manifiestos), MANIFEST_FILENAME, base_folder, 'application/json')
+
+    return {
+        'formato': formato,
+        'carpeta': base_folder,
+        'empresas': len(nuevo),
+        'subidos': len(reportes) - len(errores),
+        'sin_cambios': sin_cambios,
+        'errores': errores,
+    }
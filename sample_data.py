@@ -0,0 +1,103 @@
+"""Datos sintéticos de encuesta y puntajes para pruebas locales.
+
+Genera archivos con la misma forma que los exportados de Microsoft Forms
+(hoja "Form1") y que puntajes.xlsx, para usar con fake_graph_server.py y
+las pruebas de carga sin tocar datos reales.
+"""
+import argparse
+import os
+import random
+
+import pandas as pd
+
+ENCUESTA_FILENAME = "Encuesta sobre brechas digitales en ciberseguridad en PYMEs.xlsx"
+PUNTAJES_FILENAME = "puntajes.xlsx"
+
+SECCIONES = ['Gobernanza', 'Identificación', 'Protección', 'Detección', 'Respuesta', 'Recuperación']
+PAISES = {'Costa Rica': 'Pg011.01', 'Panamá': 'Pg011.02'}
+TAMANOS = {
+    'Costa Rica': ('Pc012', 6),
+    'Panamá': ('Pa012', 5),
+}
+OPCIONES = ['No', 'Parcialmente', 'Sí']
+
+
+def make_puntajes(n_preguntas=30, seed=0):
+    """Tabla de puntajes: por pregunta, respuestas para pequeña y mediana empresa"""
+    rng = random.Random(seed)
+    filas = []
+    for numero in range(n_preguntas):
+        pregunta = f"Pg{100 + numero:03d}"
+        seccion = SECCIONES[numero % len(SECCIONES)]
+        # Algunas preguntas solo puntúan para un tamaño
+        aplica_pequena = numero % 5 != 4
+        aplica_mediana = numero % 7 != 6
+        for opcion in range(1, len(OPCIONES) + 1):
+            codigo = f"{pregunta}.{opcion:02d}"
+            filas.append({
+                'Seccion': seccion,
+                'Pregunta': pregunta,
+                'Respuesta Pequeña': codigo if aplica_pequena else None,
+                'Respuesta Mediana': f"{pregunta}.{opcion + 10:02d}" if aplica_mediana else None,
+                'Puntaje': rng.choice([0, 1, 2, 3]) if opcion > 1 else 0,
+            })
+    return pd.DataFrame(filas)
+
+
+def make_encuesta(n_empresas=200, n_preguntas=30, seed=0, respuestas_por_empresa=1):
+    """Respuestas de la encuesta con la forma de la exportación de Forms"""
+    rng = random.Random(seed)
+    filas = []
+    id_respuesta = 1
+    for empresa in range(n_empresas):
+        pais = rng.choice(list(PAISES))
+        prefijo, n_tamanos = TAMANOS[pais]
+        tamano = rng.randint(1, n_tamanos)
+        mediana = tamano >= 3
+        for _ in range(respuestas_por_empresa):
+            fila = {
+                'ID': id_respuesta,
+                'Hora de inicio': f"2024-05-{1 + empresa % 28:02d} 09:00:00",
+                'Correo electrónico': 'anonymous',
+                'Pg001. Nombre de la empresa': f"Empresa {empresa + 1:04d}",
+                'Pg011. País': f"{pais} [{PAISES[pais]}]",
+                'Pc012. Tamaño de la empresa (Costa Rica)': None,
+                'Pa012. Tamaño de la empresa (Panamá)': None,
+            }
+            columna_tamano = ('Pc012. Tamaño de la empresa (Costa Rica)' if pais == 'Costa Rica'
+                              else 'Pa012. Tamaño de la empresa (Panamá)')
+            fila[columna_tamano] = f"Opción {tamano} [{prefijo}.{tamano:02d}]"
+            for numero in range(n_preguntas):
+                pregunta = f"Pg{100 + numero:03d}"
+                if rng.random() < 0.05:
+                    # Pregunta sin contestar
+                    fila[f"{pregunta}. Pregunta {numero + 1}"] = None
+                    continue
+                opcion = rng.randint(1, len(OPCIONES))
+                codigo = f"{pregunta}.{opcion + 10 if mediana else opcion:02d}"
+                fila[f"{pregunta}. Pregunta {numero + 1}"] = f"{OPCIONES[opcion - 1]} [{codigo}]"
+            fila['Comentarios adicionales'] = rng.choice([None, 'Sin comentarios', 'Texto libre ' * rng.randint(1, 40)])
+            filas.append(fila)
+            id_respuesta += 1
+    return pd.DataFrame(filas)
+
+
+def write_fixtures(directory, n_empresas=200, n_preguntas=30, seed=0):
+    """Escribir encuesta y puntajes en ``directory`` y devolver sus rutas"""
+    os.makedirs(directory, exist_ok=True)
+    encuesta_path = os.path.join(directory, ENCUESTA_FILENAME)
+    puntajes_path = os.path.join(directory, PUNTAJES_FILENAME)
+    make_encuesta(n_empresas, n_preguntas, seed).to_excel(encuesta_path, sheet_name="Form1", index=False)
+    make_puntajes(n_preguntas, seed).to_excel(puntajes_path, index=False)
+    return encuesta_path, puntajes_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generar archivos sintéticos de encuesta y puntajes")
+    parser.add_argument('directory')
+    parser.add_argument('--empresas', type=int, default=200)
+    parser.add_argument('--preguntas', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    for path in write_fixtures(args.directory, args.empresas, args.preguntas, args.seed):
+        print(f"Archivo generado: {path}")
@@ -0,0 +1,271 @@
+import pandas as pd
+import re
+import multiprocessing
+from io import BytesIO
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Columnas de agrupación de la hoja principal de resultados
+GROUP_COLUMNS = ['ID', 'Empresa', 'Tamaño', 'Pais', 'Seccion', 'Tamaño de empresa']
+
+# Preguntas que usa process_empresa_data: nombre, país y tamaño de empresa
+PREGUNTAS_PERFIL = ('Pg001', 'Pg011', 'Pa012', 'Pc012')
+
+# Por debajo de estas filas no compensa arrancar procesos para puntuar en paralelo
+PARALLEL_MIN_ROWS = 20000
+# Particiones por proceso: bloques pequeños reparten mejor la carga
+PARTITIONS_PER_WORKER = 4
+
+# Código de respuesta entre corchetes, p. ej. "Sí [Pg020.01]"
+RESPUESTA_RE = re.compile(r"\[([A-Za-z0-9_.]+)\]")
+
+def process_empresa_data(df_encuesta):
+    """Process company data efficiently using vectorized operations"""
+    empresas = {}
+
+    for _, row in df_encuesta.iterrows():
+        id_empresa = row['ID']
+        if id_empresa not in empresas:
+            empresas[id_empresa] = {'Empresa': '', 'Pais': '', 'tamano_empresa': 'Desconocido'}
+
+        for columna, valor in row.items():
+            if isinstance(columna, str) and isinstance(valor, str):
+                # Buscar código de pregunta para empresa
+                if 'Pg001' in columna:
+                    empresas[id_empresa]['Empresa'] = valor
+                # Buscar códigos de respuesta para país
+                if '[Pg011.01]' in valor:
+                    empresas[id_empresa]['Pais'] = 'Costa Rica'
+                elif '[Pg011.02]' in valor:
+                    empresas[id_empresa]['Pais'] = 'Panamá'
+
+                # Procesar tamaño de empresa
+                if empresas[id_empresa]['Pais'] == 'Panamá':
+                    if '[Pa012.01]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Micro'
+                    elif '[Pa012.02]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
+                    elif '[Pa012.03]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Mediana'
+                    elif '[Pa012.04]' in valor or '[Pa012.05]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Grande'
+                elif empresas[id_empresa]['Pais'] == 'Costa Rica':
+                    if '[Pc012.01]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Micro'
+                    elif '[Pc012.02]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
+                    elif '[Pc012.03]' in valor or '[Pc012.04]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Mediana'
+                    elif '[Pc012.05]' in valor or '[Pc012.06]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Grande'
+
+    return empresas
+
+def compile_puntajes(df_puntajes):
+    """Precompilar la tabla de puntajes para buscar cada respuesta en O(1).
+
+    ``respuestas`` asocia cada código de respuesta con (tamaño, sección,
+    puntaje) de la primera fila de puntajes donde aparece, como Pequeña o
+    Mediana; ``secciones`` guarda el puntaje máximo de cada sección por tamaño.
+    """
+    respuestas = {}
+    secciones = {'Pequeña': defaultdict(int), 'Mediana': defaultdict(int)}
+
+    for _, row in df_puntajes.iterrows():
+        # Calcula puntaje por tamaño suma si la fila tiene valor en la columna Pregunta Pequeña o Pregunta Mediana.
+        if row['Respuesta Pequeña'] and not pd.isna(row['Respuesta Pequeña']):
+            secciones['Pequeña'][row['Seccion']] += row['Puntaje']
+        if row['Respuesta Mediana'] and not pd.isna(row['Respuesta Mediana']):
+            secciones['Mediana'][row['Seccion']] += row['Puntaje']
+
+        # Gana la primera fila que contiene el código (y Pequeña antes que Mediana)
+        for tamano, columna in (('Pequeña', 'Respuesta Pequeña'), ('Mediana', 'Respuesta Mediana')):
+            if isinstance(row[columna], str):
+                respuestas.setdefault(row[columna], (tamano, row['Seccion'], float(row['Puntaje'])))
+
+    return {
+        'respuestas': respuestas,
+        'secciones': {tamano: dict(totales) for tamano, totales in secciones.items()},
+    }
+
+def compute_results(df_encuesta, df_puntajes, progress_callback=None, tabla_puntajes=None):
+    """Calcular las tablas de resultados a partir de la encuesta y los puntajes.
+
+    Devuelve un diccionario con las empresas detectadas y los tres DataFrames
+    que forman las hojas del Excel final. ``progress_callback(etapa, actual,
+    total)`` recibe las filas de encuesta puntuadas. ``tabla_puntajes`` permite
+    reutilizar una tabla ya compilada con ``compile_puntajes``.
+    """
+    if tabla_puntajes is None:
+        tabla_puntajes = compile_puntajes(df_puntajes)
+    empresas, df_resultados_agrupados = _score_partition(df_encuesta, tabla_puntajes, progress_callback)
+
+    # Crear DataFrame y agrupar resultados
+    if df_resultados_agrupados is None:
+        raise ValueError("No se encontraron resultados para procesar")
+    return _summarize(empresas, df_resultados_agrupados)
+
+def compute_results_parallel(df_encuesta, df_puntajes, workers=None, progress_callback=None, tabla_puntajes=None):
+    """Igual que ``compute_results`` pero repartiendo las empresas entre procesos.
+
+    La encuesta se parte por ``ID``: todas las filas de una empresa caen en la
+    misma partición, así que los grupos de la hoja principal (que incluyen el
+    ID) nunca se reparten y basta con concatenar los parciales y ordenarlos
+    como lo haría ``groupby``. La tabla de puntajes compilada se envía una sola
+    vez a cada proceso. Con pocas filas o ``workers`` <= 1 se puntúa en serie.
+    """
+    if tabla_puntajes is None:
+        tabla_puntajes = compile_puntajes(df_puntajes)
+    workers = workers or multiprocessing.cpu_count()
+    total_filas = len(df_encuesta)
+    if workers <= 1 or total_filas < PARALLEL_MIN_ROWS:
+        return compute_results(df_encuesta, df_puntajes, progress_callback, tabla_puntajes)
+
+    # Los ID vacíos forman una partición más, como en process_empresa_data (una sola clave)
+    codigos, ids = pd.factorize(df_encuesta['ID'], use_na_sentinel=False)
+    n_particiones = min(len(ids), workers * PARTITIONS_PER_WORKER) or 1
+    particiones = pd.Series(codigos % n_particiones).groupby(codigos % n_particiones).indices
+
+    empresas = {}
+    parciales = []
+    filas_puntuadas = 0
+    # 'spawn' también en Linux: hacer fork desde un servidor con hilos puede bloquear los hijos
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(tabla_puntajes,))
+    try:
+        futuros = {
+            executor.submit(_score_partition_worker, df_encuesta.iloc[posiciones]): len(posiciones)
+            for posiciones in particiones.values()
+        }
+        for futuro in as_completed(futuros):
+            empresas_particion, agrupados = futuro.result()
+            empresas.update(empresas_particion)
+            if agrupados is not None:
+                parciales.append(agrupados)
+            filas_puntuadas += futuros[futuro]
+            if progress_callback:
+                progress_callback('puntuacion', filas_puntuadas, total_filas)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if not parciales:
+        raise ValueError("No se encontraron resultados para procesar")
+
+    # Mismo orden de empresas y de filas que la versión en serie: factorize numera los ID por
+    # orden de aparición. NaN no es igual a sí mismo, así que el ID vacío se busca aparte.
+    posiciones = {id_empresa: numero for numero, id_empresa in enumerate(ids) if not pd.isna(id_empresa)}
+    posicion_vacio = next((numero for numero, id_empresa in enumerate(ids) if pd.isna(id_empresa)), len(ids))
+    empresas = dict(sorted(
+        empresas.items(),
+        key=lambda item: posicion_vacio if pd.isna(item[0]) else posiciones[item[0]]
+    ))
+    df_resultados_agrupados = pd.concat(parciales, ignore_index=True) \
+        .sort_values(GROUP_COLUMNS, kind='stable', ignore_index=True)
+    return _summarize(empresas, df_resultados_agrupados)
+
+_tabla_worker = {}
+
+def _init_worker(tabla_puntajes):
+    _tabla_worker['tabla'] = tabla_puntajes
+
+def _score_partition_worker(df_encuesta):
+    return _score_partition(df_encuesta, _tabla_worker['tabla'])
+
+def _score_partition(df_encuesta, tabla_puntajes, progress_callback=None):
+    """Puntuar un conjunto de empresas completas: (empresas, hoja principal o None)"""
+    # Procesar los datos
+    empresas = process_empresa_data(df_encuesta)
+    respuestas = tabla_puntajes['respuestas']
+    totales_seccion = tabla_puntajes['secciones']
+
+    # Preparar resultados
+    resultados = []
+    total_filas = len(df_encuesta)
+    paso = max(1, total_filas // 100)
+
+    # Procesar cada respuesta de la encuesta
+    for numero_fila, (_, row_encuesta) in enumerate(df_encuesta.iterrows(), start=1):
+        if progress_callback and (numero_fila % paso == 0 or numero_fila == total_filas):
+            progress_callback('puntuacion', numero_fila, total_filas)
+
+        id_empresa = row_encuesta['ID']
+        empresa_info = empresas.get(id_empresa, {})
+        if not empresa_info.get('Empresa'):
+            continue
+
+        # Procesar cada respuesta de la fila
+        for columna, respuesta in row_encuesta.items():
+            if not isinstance(respuesta, str):
+                continue
+
+            respuesta_match = RESPUESTA_RE.search(respuesta)
+            if not respuesta_match:
+                continue
+
+            puntaje_info = respuestas.get(respuesta_match.group(1))
+            if puntaje_info is not None:
+                tamano, seccion, puntaje = puntaje_info
+                resultados.append({
+                    'ID': id_empresa,
+                    'Empresa': empresa_info.get('Empresa', ''),
+                    'Tamaño': tamano,
+                    'Tamaño de empresa': empresa_info.get('tamano_empresa', 'Desconocido'),
+                    'Pais': empresa_info.get('Pais', ''),
+                    'Puntaje': puntaje,
+                    'Seccion': seccion,
+                    'Puntaje Seccion': totales_seccion[tamano].get(seccion, 0)
+                })
+
+    if not resultados:
+        return empresas, None
+
+    df_resultados = pd.DataFrame(resultados)
+
+    # Agrupar resultados por las columnas necesarias y sumar puntajes
+    df_resultados_agrupados = df_resultados.groupby(GROUP_COLUMNS, as_index=False).agg({
+        'Puntaje': 'sum',
+        'Puntaje Seccion': 'first'  # Tomamos el primer valor ya que es el mismo para cada sección
+    })
+    return empresas, df_resultados_agrupados
+
+def _summarize(empresas, df_resultados_agrupados):
+    """Hojas por empresa y por país a partir de la hoja principal"""
+    # Calcular puntaje total por empresa
+    df_puntaje_total = df_resultados_agrupados.groupby(['ID', 'Empresa'], as_index=False).agg({
+        'Puntaje': 'sum',
+        'Puntaje Seccion': 'sum'
+    })
+    # Calcular porcentaje total
+    df_puntaje_total['Porcentaje Total'] = df_puntaje_total['Puntaje'] / df_puntaje_total['Puntaje Seccion']
+
+    # Calcular puntaje por pais promedia Puntaje
+    df_puntaje_total_pais = df_resultados_agrupados.groupby(['Pais', 'Seccion'], as_index=False).agg({
+        'Puntaje': 'mean',
+        'Puntaje Seccion': 'first'
+    })
+
+    return {
+        'empresas': empresas,
+        'resultados': df_resultados_agrupados,
+        'totales': df_puntaje_total,
+        'paises': df_puntaje_total_pais,
+    }
+
+def build_excel(tablas, progress_callback=None):
+    """Generar el contenido del Excel final (tabla_radar.xlsx) en memoria"""
+    output = BytesIO()
+    hojas = [
+        (tablas['resultados'], {}),
+        (tablas['totales'][['ID', 'Empresa', 'Porcentaje Total']], {'sheet_name': 'General por empresas'}),
+        (tablas['paises'], {'sheet_name': 'General por paises'}),
+    ]
+
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        for numero_hoja, (df, opciones) in enumerate(hojas, start=1):
+            df.to_excel(writer, index=False, **opciones)
+            if progress_callback:
+                progress_callback('excel', numero_hoja, len(hojas))
+
+    # Obtener el contenido del archivo en memoria
+    output.seek(0)
+    return output.getvalue()
@@ -0,0 +1,358 @@
+"""Regresión de resultados y rendimiento del cálculo de puntajes.
+
+Compara la implementación de referencia (el algoritmo original: una
+búsqueda en la tabla de puntajes por cada respuesta) con las actuales de
+scoring.py sobre datos fijos y aleatorios de sample_data.py. Las hojas del
+Excel (resultados, totales por empresa y medias por país) y las empresas
+detectadas deben coincidir con la referencia, con tolerancia en los
+números. Para cada implementación se informa el tiempo y el pico de memoria.
+
+Antes de fusionar un cambio de rendimiento en scoring.py (o en la lectura de
+la encuesta, con ``--excel``) este script debe terminar sin diferencias. El
+conjunto 'encabezados-sin-codigo' pasa siempre por Excel y load_encuesta.
+
+Uso:
+    python scoring_check.py --aleatorios 10 --seed 1234
+    python scoring_check.py --empresas 2000 --excel --json
+
+El pico de memoria se mide con tracemalloc en este proceso: no incluye los
+procesos de compute_results_parallel.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+
+import pandas as pd
+
+import scoring
+from encuesta import HOJA_ENCUESTA, load_encuesta
+from sample_data import make_encuesta, make_puntajes
+from scoring import compute_results, compute_results_parallel
+
+HOJAS = ('resultados', 'totales', 'paises')
+RTOL = 1e-9
+ATOL = 1e-9
+
+
+def reference_empresa_data(df_encuesta):
+    """Copia del process_empresa_data original; no cambiar al optimizar scoring.py"""
+    empresas = {}
+
+    for _, row in df_encuesta.iterrows():
+        id_empresa = row['ID']
+        if id_empresa not in empresas:
+            empresas[id_empresa] = {'Empresa': '', 'Pais': '', 'tamano_empresa': 'Desconocido'}
+
+        for columna, valor in row.items():
+            if isinstance(columna, str) and isinstance(valor, str):
+                if 'Pg001' in columna:
+                    empresas[id_empresa]['Empresa'] = valor
+                if '[Pg011.01]' in valor:
+                    empresas[id_empresa]['Pais'] = 'Costa Rica'
+                elif '[Pg011.02]' in valor:
+                    empresas[id_empresa]['Pais'] = 'Panamá'
+
+                if empresas[id_empresa]['Pais'] == 'Panamá':
+                    if '[Pa012.01]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Micro'
+                    elif '[Pa012.02]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
+                    elif '[Pa012.03]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Mediana'
+                    elif '[Pa012.04]' in valor or '[Pa012.05]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Grande'
+                elif empresas[id_empresa]['Pais'] == 'Costa Rica':
+                    if '[Pc012.01]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Micro'
+                    elif '[Pc012.02]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Pequeña'
+                    elif '[Pc012.03]' in valor or '[Pc012.04]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Mediana'
+                    elif '[Pc012.05]' in valor or '[Pc012.06]' in valor:
+                        empresas[id_empresa]['tamano_empresa'] = 'Grande'
+
+    return empresas
+
+
+def reference_results(df_encuesta, df_puntajes):
+    """Cálculo original de generate_excel, con las mismas claves que compute_results"""
+    empresas = reference_empresa_data(df_encuesta)
+
+    secciones_puntaje_pequena = defaultdict(int)
+    secciones_puntaje_mediana = defaultdict(int)
+    for _, row in df_puntajes.iterrows():
+        if row['Respuesta Pequeña'] and not pd.isna(row['Respuesta Pequeña']):
+            secciones_puntaje_pequena[row['Seccion']] += row['Puntaje']
+        if row['Respuesta Mediana'] and not pd.isna(row['Respuesta Mediana']):
+            secciones_puntaje_mediana[row['Seccion']] += row['Puntaje']
+
+    resultados = []
+    for _, row_encuesta in df_encuesta.iterrows():
+        id_empresa = row_encuesta['ID']
+        empresa_info = empresas.get(id_empresa, {})
+        if not empresa_info.get('Empresa'):
+            continue
+
+        for columna, respuesta in row_encuesta.items():
+            if not isinstance(respuesta, str):
+                continue
+            respuesta_match = re.search(r"\[([A-Za-z0-9_.]+)\]", str(respuesta))
+            if not respuesta_match:
+                continue
+            respuesta_code = respuesta_match.group(1)
+
+            puntaje_match = df_puntajes[
+                (df_puntajes['Respuesta Pequeña'] == respuesta_code) |
+                (df_puntajes['Respuesta Mediana'] == respuesta_code)
+            ]
+            if not puntaje_match.empty:
+                tamano = 'Pequeña' if respuesta_code == puntaje_match['Respuesta Pequeña'].iloc[0] else 'Mediana'
+                seccion = puntaje_match['Seccion'].iloc[0]
+                resultados.append({
+                    'ID': id_empresa,
+                    'Empresa': empresa_info.get('Empresa', ''),
+                    'Tamaño': tamano,
+                    'Tamaño de empresa': empresa_info.get('tamano_empresa', 'Desconocido'),
+                    'Pais': empresa_info.get('Pais', ''),
+                    'Puntaje': float(puntaje_match['Puntaje'].iloc[0]),
+                    'Seccion': seccion,
+                    'Puntaje Seccion': secciones_puntaje_pequena[seccion] if tamano == 'Pequeña' else secciones_puntaje_mediana[seccion]
+                })
+
+    if not resultados:
+        raise ValueError("No se encontraron resultados para procesar")
+    df_resultados = pd.DataFrame(resultados)
+
+    df_resultados_agrupados = df_resultados.groupby(
+        ['ID', 'Empresa', 'Tamaño', 'Pais', 'Seccion', 'Tamaño de empresa'],
+        as_index=False
+    ).agg({
+        'Puntaje': 'sum',
+        'Puntaje Seccion': 'first'
+    })
+    df_puntaje_total = df_resultados_agrupados.groupby(['ID', 'Empresa'], as_index=False).agg({
+        'Puntaje': 'sum',
+        'Puntaje Seccion': 'sum'
+    })
+    df_puntaje_total['Porcentaje Total'] = df_puntaje_total['Puntaje'] / df_puntaje_total['Puntaje Seccion']
+    df_puntaje_total_pais = df_resultados_agrupados.groupby(['Pais', 'Seccion'], as_index=False).agg({
+        'Puntaje': 'mean',
+        'Puntaje Seccion': 'first'
+    })
+
+    return {
+        'empresas': empresas,
+        'resultados': df_resultados_agrupados,
+        'totales': df_puntaje_total,
+        'paises': df_puntaje_total_pais,
+    }
+
+
+def edge_case_fixture():
+    """Casos límite que los datos de sample_data.py no cubren"""
+    df_puntajes = make_puntajes(12, seed=3)
+    # Código que aparece como Mediana y después como Pequeña: cuenta la primera fila
+    df_puntajes.loc[len(df_puntajes)] = {
+        'Seccion': 'Protección', 'Pregunta': 'Pg101', 'Respuesta Pequeña': 'Pg101.12',
+        'Respuesta Mediana': None, 'Puntaje': 5,
+    }
+
+    df_encuesta = make_encuesta(30, 12, seed=3).astype(object)
+    nombre, pais = 'Pg001. Nombre de la empresa', 'Pg011. País'
+    # Misma empresa respondida dos veces (mismo ID)
+    df_encuesta.loc[3, 'ID'] = df_encuesta.loc[2, 'ID']
+    # Sin nombre: se descarta
+    df_encuesta.loc[5, nombre] = None
+    # País desconocido: sin país y tamaño 'Desconocido'
+    df_encuesta.loc[7, pais] = 'Otro [Pg011.09]'
+    # Código que no está en puntajes, número en vez de texto y dos códigos en una celda
+    df_encuesta.loc[9, 'Pg100. Pregunta 1'] = 'No sé [Pg999.01]'
+    df_encuesta.loc[11, 'Pg101. Pregunta 2'] = 3
+    df_encuesta.loc[13, 'Pg102. Pregunta 3'] = 'Sí [Pg102.03] No [Pg102.01]'
+    # Filas sin ID
+    df_encuesta.loc[[15, 21], 'ID'] = None
+    return df_encuesta, df_puntajes
+
+
+def repeated_ids(df_encuesta, respuestas_por_empresa, seed):
+    """Mismo ID para las respuestas de cada empresa, en filas mezcladas (no contiguas)"""
+    df_encuesta = df_encuesta.assign(ID=df_encuesta.index // respuestas_por_empresa + 1)
+    return df_encuesta.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def uncoded_headers_fixture():
+    """País, tamaños y una pregunta puntuada con encabezados sin código de pregunta"""
+    df_encuesta = make_encuesta(80, 20, seed=6).rename(columns={
+        'Pg011. País': 'País',
+        'Pc012. Tamaño de la empresa (Costa Rica)': 'Tamaño CR',
+        'Pa012. Tamaño de la empresa (Panamá)': 'Tamaño PA',
+        'Pg105. Pregunta 6': '¿Tiene respaldos?',
+    })
+    return df_encuesta, make_puntajes(20, seed=6)
+
+
+def build_fixtures(n_empresas, aleatorios, seed):
+    """[(nombre, encuesta, puntajes, por_excel)]: fijos y ``aleatorios`` generados a partir de ``seed``
+
+    Con ``por_excel`` la encuesta pasa por Excel aunque no se use ``--excel``.
+    """
+    fixtures = [
+        ('muestra', make_encuesta(n_empresas, 30, seed=0), make_puntajes(30, seed=0), False),
+        ('repetidas', repeated_ids(make_encuesta(50, 20, seed=2, respuestas_por_empresa=3), 3, seed=2),
+         make_puntajes(20, seed=2), False),
+        ('casos-limite',) + edge_case_fixture() + (False,),
+        ('encabezados-sin-codigo',) + uncoded_headers_fixture() + (True,),
+    ]
+    rng = random.Random(seed)
+    for _ in range(aleatorios):
+        semilla = rng.randrange(10 ** 6)
+        empresas = rng.randint(5, 120)
+        preguntas = rng.randint(3, 40)
+        respuestas = rng.randint(1, 3)
+        fixtures.append((
+            f"aleatorio-{semilla}",
+            repeated_ids(make_encuesta(empresas, preguntas, seed=semilla, respuestas_por_empresa=respuestas),
+                         respuestas, seed=semilla),
+            make_puntajes(preguntas, seed=semilla),
+            False,
+        ))
+    return fixtures
+
+
+def via_excel(df_encuesta, df_puntajes, temp_dir):
+    """Encuesta tal como la leen la referencia (read_excel) y la app (load_encuesta)"""
+    path = os.path.join(temp_dir, "encuesta.xlsx")
+    df_encuesta.to_excel(path, sheet_name=HOJA_ENCUESTA, index=False)
+    return pd.read_excel(path, sheet_name=HOJA_ENCUESTA), load_encuesta(path, df_puntajes)
+
+
+def measure(func, *args, repeat=1):
+    """(resultado, mejor tiempo en s, pico de memoria en bytes) de ``func(*args)``"""
+    tiempos = []
+    resultado = None
+    for _ in range(repeat):
+        inicio = time.perf_counter()
+        resultado = func(*args)
+        tiempos.append(time.perf_counter() - inicio)
+
+    # Ejecución aparte para la memoria: tracemalloc ralentiza y falsearía el tiempo
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resultado, min(tiempos), pico
+
+
+def _normalizar(df):
+    """Sin categóricas ni índice, para comparar solo valores y orden de filas"""
+    df = df.reset_index(drop=True)
+    return df.astype({columna: object for columna in df.columns if isinstance(df[columna].dtype, pd.CategoricalDtype)})
+
+
+def compare_results(esperado, obtenido, rtol=RTOL, atol=ATOL):
+    """Lista de diferencias entre dos resultados de compute_results (vacía si coinciden)"""
+    diferencias = []
+    for hoja in HOJAS:
+        try:
+            pd.testing.assert_frame_equal(
+                _normalizar(esperado[hoja]), _normalizar(obtenido[hoja]),
+                check_dtype=False, check_exact=False, rtol=rtol, atol=atol
+            )
+        except AssertionError as e:
+            diferencias.append(f"{hoja}: {' '.join(str(e).split())[:500]}")
+    esperadas, obtenidas = _empresas(esperado['empresas']), _empresas(obtenido['empresas'])
+    if list(esperadas.items()) != list(obtenidas.items()):
+        distintas = [id_empresa for id_empresa in set(esperadas) | set(obtenidas)
+                     if esperadas.get(id_empresa) != obtenidas.get(id_empresa)]
+        detalle = f"{len(distintas)} distintas, p. ej. IDs {sorted(map(str, distintas))[:5]}" if distintas \
+            else "mismas empresas en otro orden"
+        diferencias.append(f"empresas: {detalle}")
+    return diferencias
+
+
+def _empresas(empresas):
+    """Empresas con el ID vacío como una clave comparable (NaN no es igual a sí mismo)"""
+    return {('<sin ID>' if pd.isna(id_empresa) else id_empresa): info for id_empresa, info in empresas.items()}
+
+
+def run(fixtures, workers=2, repeat=1, excel=False, rtol=RTOL, atol=ATOL):
+    candidatas = {
+        'compute_results': lambda df_encuesta, df_puntajes: compute_results(df_encuesta, df_puntajes),
+        'compute_results_parallel': lambda df_encuesta, df_puntajes: compute_results_parallel(
+            df_encuesta, df_puntajes, workers=workers),
+    }
+    filas = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for nombre, df_encuesta, df_puntajes, por_excel in fixtures:
+            encuesta_referencia = encuesta_candidata = df_encuesta
+            if excel or por_excel:
+                encuesta_referencia, encuesta_candidata = via_excel(df_encuesta, df_puntajes, temp_dir)
+
+            esperado, tiempo_referencia, pico = measure(reference_results, encuesta_referencia, df_puntajes,
+                                                        repeat=repeat)
+            base = {'fixture': nombre, 'filas': len(df_encuesta), 'resultados': len(esperado['resultados'])}
+            filas.append(dict(base, implementacion='referencia', tiempo_s=round(tiempo_referencia, 4),
+                              pico_mb=round(pico / 1e6, 2), aceleracion=1.0, diferencias=[]))
+
+            for implementacion, func in candidatas.items():
+                try:
+                    obtenido, tiempo, pico = measure(func, encuesta_candidata, df_puntajes, repeat=repeat)
+                    diferencias = compare_results(esperado, obtenido, rtol, atol)
+                except Exception as e:
+                    tiempo, pico, diferencias = float('nan'), 0, [f"error: {e!r}"]
+                filas.append(dict(base, implementacion=implementacion, tiempo_s=round(tiempo, 4),
+                                  pico_mb=round(pico / 1e6, 2),
+                                  aceleracion=round(tiempo_referencia / tiempo, 1) if tiempo else None,
+                                  diferencias=diferencias))
+    return filas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regresión y rendimiento del cálculo de puntajes")
+    parser.add_argument('--empresas', type=int, default=200, help="Empresas del conjunto fijo 'muestra'")
+    parser.add_argument('--aleatorios', type=int, default=5, help="Conjuntos aleatorios adicionales")
+    parser.add_argument('--seed', type=int, default=None,
+                        help="Semilla de los conjuntos aleatorios (por defecto una nueva en cada ejecución)")
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=1, help="Repeticiones por medición (se toma la mejor)")
+    parser.add_argument('--excel', action='store_true',
+                        help="Pasar la encuesta por Excel: read_excel para la referencia, load_encuesta para el resto")
+    parser.add_argument('--rtol', type=float, default=RTOL)
+    parser.add_argument('--atol', type=float, default=ATOL)
+    parser.add_argument('--json', action='store_true', help="Imprimir el resultado como JSON")
+    args = parser.parse_args()
+
+    seed = args.seed if args.seed is not None else random.randrange(10 ** 6)
+    # Forzar el reparto en procesos aunque los conjuntos sean pequeños
+    scoring.PARALLEL_MIN_ROWS = 0
+
+    filas = run(build_fixtures(args.empresas, args.aleatorios, seed), args.workers, args.repeat,
+                args.excel, args.rtol, args.atol)
+    fallos = [fila for fila in filas if fila['diferencias']]
+
+    if args.json:
+        print(json.dumps({'seed': seed, 'resultados': filas, 'fallos': len(fallos)}, indent=2, ensure_ascii=False))
+    else:
+        print(f"Semilla de los conjuntos aleatorios: {seed}")
+        print(f"{'conjunto':<24} {'filas':>6} {'implementación':<25} {'tiempo s':>9} {'pico MB':>8} {'x ref':>6}  estado")
+        for fila in filas:
+            estado = 'DIFERENTE' if fila['diferencias'] else 'ok'
+            print(f"{fila['fixture']:<24} {fila['filas']:>6} {fila['implementacion']:<25} "
+                  f"{fila['tiempo_s']:>9.4f} {fila['pico_mb']:>8.2f} {fila['aceleracion'] or 0:>6.1f}  {estado}")
+            for diferencia in fila['diferencias']:
+                print(f"    {diferencia}")
+        print(f"{len(fallos)} implementaciones con diferencias" if fallos else "Sin diferencias con la referencia")
+    return 1 if fallos else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""Informe de tiempo de importación de app_desktop.py.
+
+Ejecuta ``python -X importtime`` en un proceso limpio, muestra los módulos
+que más tardan y falla (código de salida 1) si algún módulo pesado se
+importa al iniciar o si se supera el presupuesto de tiempo. Sirve para
+detectar regresiones en el arranque del ejecutable.
+
+Uso:
+    python startup_report.py [--budget-ms 300] [--top 15]
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+# Módulos que no deben cargarse antes de mostrar la ventana
+FORBIDDEN_AT_STARTUP = ('pandas', 'numpy', 'openpyxl', 'requests', 'graph_client', 'scoring', 'encuesta', 'validacion', 'reportes', 'historial')
+
+LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)$")
+
+
+def measure(module='app_desktop'):
+    """Devolver [(modulo, propio_us, acumulado_us, nivel)] de importar ``module``"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"No se pudo importar {module}:\n{completed.stderr}")
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+
+    # Quedarse solo con el árbol de ``module`` (sin site, codecs, etc. del arranque)
+    end = max(i for i, entry in enumerate(entries) if entry[0] == module and entry[3] == 0)
+    start = end
+    while start > 0 and entries[start - 1][3] > 0:
+        start -= 1
+    return entries[start:end + 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de importación de la app de escritorio")
+    parser.add_argument('--module', default='app_desktop')
+    parser.add_argument('--budget-ms', type=float, default=300,
+                        help="Tiempo máximo de importación permitido")
+    parser.add_argument('--top', type=int, default=15, help="Módulos a mostrar")
+    args = parser.parse_args()
+
+    entries = measure(args.module)
+    total_ms = next(cumulative for name, _, cumulative, _ in entries if name == args.module) / 1000
+    imported = {name for name, _, _, _ in entries}
+
+    print(f"Importar {args.module}: {total_ms:.1f} ms (presupuesto {args.budget_ms:.0f} ms)")
+    print("Módulos más lentos (acumulado):")
+    top_level = [e for e in entries if e[3] <= 1 and e[0] != args.module]
+    for name, _, cumulative, _ in sorted(top_level, key=lambda e: e[2], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    problems = [f"'{name}' se importa al iniciar" for name in FORBIDDEN_AT_STARTUP if name in imported]
+    if total_ms > args.budget_ms:
+        problems.append(f"la importación tarda {total_ms:.1f} ms (> {args.budget_ms:.0f} ms)")
+    for problem in problems:
+        print(f"ERROR: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,192 @@
+"""Validación de los archivos de entrada antes de puntuar.
+
+Cada comprobación devuelve un informe (diccionario) con ``errores``,
+``advertencias`` y datos de cobertura; ``raise_if_invalid`` lanza
+``ValidationError`` si hay errores. El orden pensado es:
+
+1. ``validate_puntajes``: columnas y códigos de puntajes.xlsx (archivo pequeño).
+2. ``validate_encuesta_headers``: solo la fila de encabezados de la encuesta,
+   antes de recorrer la hoja completa.
+3. ``validate_coverage``: códigos de respuesta de la encuesta ya leída frente
+   a los de puntajes, y preguntas de perfil (país y tamaño), antes de puntuar.
+
+La puntuación busca los códigos en las celdas, no en los encabezados (salvo
+el nombre de la empresa, Pg001), así que un encabezado sin código no es un
+error: lo que falte se detecta en el paso 3 sobre las columnas que leyó
+``encuesta.load_encuesta``.
+"""
+import logging
+
+import pandas as pd
+
+from encuesta import HOJA_ENCUESTA, read_headers, scored_question_codes
+from scoring import PREGUNTAS_PERFIL, RESPUESTA_RE
+
+logger = logging.getLogger(__name__)
+
+COLUMNAS_PUNTAJES = ('Seccion', 'Puntaje', 'Respuesta Pequeña', 'Respuesta Mediana')
+# Máximo de códigos listados por categoría en el informe
+MAX_CODIGOS = 50
+# Código de país -> (país, pregunta de tamaño de empresa), como en scoring.process_empresa_data
+PAISES = {'Pg011.01': ('Costa Rica', 'Pc012'), 'Pg011.02': ('Panamá', 'Pa012')}
+
+
+class ValidationError(ValueError):
+    """Los archivos de entrada no permiten generar el reporte"""
+
+    def __init__(self, reporte):
+        self.reporte = reporte
+        lineas = [f"Validación fallida ({reporte['archivo']}):"] + [f"- {e}" for e in reporte['errores']]
+        super().__init__("\n".join(lineas))
+
+
+def _reporte(archivo):
+    return {'archivo': archivo, 'valido': True, 'errores': [], 'advertencias': []}
+
+
+def _error(reporte, mensaje):
+    reporte['errores'].append(mensaje)
+    reporte['valido'] = False
+
+
+def _lista(codigos):
+    return sorted(codigos)[:MAX_CODIGOS]
+
+
+def raise_if_invalid(reporte):
+    for advertencia in reporte['advertencias']:
+        logger.warning("%s", advertencia)
+    if not reporte['valido']:
+        raise ValidationError(reporte)
+    return reporte
+
+
+def validate_puntajes(df_puntajes):
+    """Columnas obligatorias, puntajes numéricos y al menos un código de respuesta"""
+    reporte = _reporte('puntajes')
+    faltantes = [c for c in COLUMNAS_PUNTAJES if c not in df_puntajes.columns]
+    if faltantes:
+        _error(reporte, f"Faltan columnas en puntajes: {', '.join(faltantes)} "
+                        f"(columnas encontradas: {', '.join(map(str, df_puntajes.columns))})")
+        return reporte
+
+    puntajes = pd.to_numeric(df_puntajes['Puntaje'], errors='coerce')
+    no_numericos = df_puntajes.index[puntajes.isna() & df_puntajes['Puntaje'].notna()]
+    if len(no_numericos):
+        # +2: fila de encabezados y numeración desde 1 de Excel
+        _error(reporte, f"'Puntaje' no numérico en las filas {', '.join(str(i + 2) for i in no_numericos[:20])}")
+
+    codigos = {c for columna in ('Respuesta Pequeña', 'Respuesta Mediana')
+               for c in df_puntajes[columna] if isinstance(c, str)}
+    if not codigos:
+        _error(reporte, "puntajes no contiene ningún código de respuesta")
+    sin_seccion = df_puntajes['Seccion'].isna() & (
+        df_puntajes['Respuesta Pequeña'].notna() | df_puntajes['Respuesta Mediana'].notna())
+    if sin_seccion.any():
+        reporte['advertencias'].append(f"{int(sin_seccion.sum())} filas de puntajes con código pero sin 'Seccion'")
+
+    reporte['codigos'] = len(codigos)
+    reporte['preguntas'] = len(scored_question_codes(df_puntajes))
+    return reporte
+
+
+def validate_encuesta_headers(path, df_puntajes, sheet_name=HOJA_ENCUESTA):
+    """Comprobar la fila de encabezados: hoja, nombre de empresa y preguntas puntuadas"""
+    reporte = _reporte('encuesta')
+    try:
+        encabezados = read_headers(path, sheet_name)
+    except KeyError:
+        _error(reporte, f"La encuesta no tiene la hoja '{sheet_name}'")
+        return reporte
+    if not encabezados:
+        _error(reporte, "La encuesta no tiene encabezados")
+        return reporte
+
+    # El nombre es la única pregunta que se busca por el encabezado
+    if not any('Pg001' in encabezado for encabezado in encabezados):
+        _error(reporte, "No hay ninguna columna Pg001 (nombre de la empresa)")
+
+    puntuadas = scored_question_codes(df_puntajes)
+    con_columna = {codigo for codigo in puntuadas if any(codigo in e for e in encabezados)}
+    if puntuadas and not con_columna:
+        # Las respuestas se buscarán por su código en las celdas; la cobertura se verá al leer
+        reporte['advertencias'].append("Ningún encabezado de la encuesta contiene códigos de pregunta de puntajes")
+    sin_columna = puntuadas - con_columna
+    if con_columna and sin_columna:
+        reporte['advertencias'].append(
+            f"{len(sin_columna)} preguntas de puntajes no tienen columna en la encuesta: {', '.join(_lista(sin_columna))}")
+
+    reporte['columnas'] = len(encabezados)
+    reporte['preguntas_con_columna'] = len(con_columna)
+    reporte['preguntas_sin_columna'] = _lista(sin_columna)
+    return reporte
+
+
+def _codigos_columna(serie):
+    """Códigos de respuesta distintos de una columna (las categóricas solo miran sus categorías)"""
+    valores = serie.cat.categories if isinstance(serie.dtype, pd.CategoricalDtype) else serie.dropna().unique()
+    codigos = set()
+    for valor in valores:
+        if isinstance(valor, str):
+            codigos.update(RESPUESTA_RE.findall(valor))
+    return codigos
+
+
+def _validate_perfil(reporte, codigos_por_columna):
+    """País y, para cada país presente, su pregunta de tamaño: error si no aparecen en ninguna celda"""
+    columnas_perfil = {pregunta: [] for pregunta in PREGUNTAS_PERFIL if pregunta != 'Pg001'}
+    perfil = set()
+    for columna, codigos in codigos_por_columna.items():
+        for pregunta, columnas in columnas_perfil.items():
+            if any(codigo.rsplit('.', 1)[0] == pregunta for codigo in codigos):
+                columnas.append(columna)
+        perfil |= codigos
+
+    paises = [PAISES[codigo] for codigo in PAISES if codigo in perfil]
+    if not paises:
+        _error(reporte, f"Ninguna respuesta contiene el país ({' o '.join(f'[{c}]' for c in PAISES)}); "
+                        f"todas las empresas quedarían sin país")
+    for pais, pregunta in paises:
+        if not columnas_perfil[pregunta]:
+            _error(reporte, f"Hay empresas de {pais} pero ninguna respuesta contiene su tamaño "
+                            f"([{pregunta}.xx]); todas quedarían como 'Desconocido'")
+    reporte['columnas_perfil'] = columnas_perfil
+
+
+def validate_coverage(df_encuesta, df_puntajes):
+    """Códigos de la encuesta sin puntaje, códigos de puntajes nunca respondidos y preguntas de perfil"""
+    reporte = _reporte('encuesta')
+    if 'ID' not in df_encuesta.columns or df_encuesta.empty:
+        _error(reporte, "La encuesta no tiene respuestas")
+        return reporte
+
+    codigos_por_columna = {
+        columna: _codigos_columna(df_encuesta[columna])
+        for columna in df_encuesta.columns if columna != 'ID' and 'Pg001' not in columna
+    }
+    _validate_perfil(reporte, codigos_por_columna)
+
+    en_encuesta = set().union(*codigos_por_columna.values())
+    en_encuesta = {c for c in en_encuesta if c.rsplit('.', 1)[0] not in PREGUNTAS_PERFIL}
+
+    en_puntajes = {c for columna in ('Respuesta Pequeña', 'Respuesta Mediana')
+                   for c in df_puntajes[columna] if isinstance(c, str)}
+    reconocidos = en_encuesta & en_puntajes
+    sin_puntaje = en_encuesta - en_puntajes
+    sin_respuestas = en_puntajes - en_encuesta
+
+    if not reconocidos:
+        _error(reporte, "Ningún código de respuesta de la encuesta aparece en puntajes; "
+                        "no se obtendría ningún resultado")
+    if sin_puntaje:
+        reporte['advertencias'].append(
+            f"{len(sin_puntaje)} códigos de la encuesta no están en puntajes: {', '.join(_lista(sin_puntaje))}")
+
+    reporte['cobertura'] = {
+        'codigos_encuesta': len(en_encuesta),
+        'codigos_reconocidos': len(reconocidos),
+        'codigos_sin_puntaje': _lista(sin_puntaje),
+        'codigos_sin_respuestas': len(sin_respuestas),
+        'ejemplos_sin_respuestas': _lista(sin_respuestas),
+    }
+    return reporte
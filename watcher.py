@@ -0,0 +1,124 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from graph_client import DeltaResyncRequired
+from registro import correlation_context
+
+logger = logging.getLogger(__name__)
+
+
+class DeltaWatcher(threading.Thread):
+    """Vigila los archivos de entrada con ``/delta`` y regenera al cambiar.
+
+    Cada ``interval`` segundos pide a Graph solo los cambios del drive desde
+    la última consulta (metadatos, sin descargar contenido). Si cambia alguno
+    de los archivos vigilados espera a que pasen ``debounce`` segundos sin
+    nuevos cambios antes de llamar a ``on_change``, para que una ráfaga de
+    ediciones produzca una sola regeneración.
+    """
+
+    def __init__(self, graph, get_token, site_url, file_paths, on_change, interval=60, debounce=120):
+        super().__init__(name='delta-watcher', daemon=True)
+        self.graph = graph
+        self.get_token = get_token
+        self.site_url = site_url
+        self.file_paths = list(file_paths)
+        self.on_change = on_change
+        self.interval = interval
+        self.debounce = debounce
+
+        self._stop_event = threading.Event()
+        self._drive_id = None
+        self._delta_link = None
+        self._watched_ids = set()
+        self._watched_names = {path.rsplit('/', 1)[-1] for path in self.file_paths}
+        self._pending_since = None
+        self._last_change = None
+        self._estado = {
+            'ultima_consulta': None,
+            'ultimo_cambio': None,
+            'ultima_regeneracion': None,
+            'ultimo_error': None,
+            'regeneraciones': 0,
+        }
+
+    def stop(self):
+        self._stop_event.set()
+
+    def status(self):
+        estado = dict(self._estado)
+        estado.update({
+            'activo': self.is_alive(),
+            'intervalo': self.interval,
+            'debounce': self.debounce,
+            'cambio_pendiente': self._pending_since is not None,
+        })
+        return estado
+
+    def run(self):
+        espera = 0
+        while not self._stop_event.wait(espera):
+            # Cada consulta (y la regeneración que dispare) con su propio correlation_id
+            with correlation_context():
+                try:
+                    self.poll()
+                    self._estado['ultimo_error'] = None
+                except Exception as e:
+                    logger.exception("Error en el watcher de SharePoint: %s", e)
+                    self._estado['ultimo_error'] = str(e)
+            espera = self._next_wait()
+
+    def _next_wait(self):
+        """Con un cambio pendiente se consulta de nuevo al vencer el debounce"""
+        if self._last_change is None:
+            return self.interval
+        restante = self._last_change + self.debounce - time.monotonic()
+        if restante <= 0:
+            # La regeneración falló: reintentar en la siguiente consulta normal
+            return self.interval
+        return max(1, min(self.interval, restante))
+
+    def _start(self, access_token):
+        """Resolver los archivos vigilados y tomar el punto de partida de /delta"""
+        sitio = self.graph.resolve_site(access_token, self.site_url, self.file_paths)
+        self._drive_id = sitio['drive_id']
+        self._watched_ids = {item['id'] for item in sitio['items'].values() if item}
+        _, self._delta_link = self.graph.delta(access_token, self._drive_id)
+        logger.info("Watcher iniciado sobre el drive %s (%d archivos)", self._drive_id, len(self._watched_ids))
+
+    def poll(self):
+        """Una consulta a /delta; dispara ``on_change`` si venció el debounce"""
+        access_token = self.get_token()
+        if self._delta_link is None:
+            self._start(access_token)
+        else:
+            try:
+                cambios, self._delta_link = self.graph.delta(access_token, self._drive_id, self._delta_link)
+            except DeltaResyncRequired:
+                # Se perdió el rastro de cambios: volver a empezar y regenerar por si acaso
+                logger.warning("Token de /delta expirado; resincronizando")
+                self._delta_link = None
+                self._start(access_token)
+                cambios = [{'id': item_id} for item_id in self._watched_ids]
+
+            relevantes = [
+                item for item in cambios
+                if item.get('id') in self._watched_ids or item.get('name') in self._watched_names
+            ]
+            if relevantes:
+                ahora = time.monotonic()
+                self._pending_since = self._pending_since or ahora
+                self._last_change = ahora
+                self._estado['ultimo_cambio'] = datetime.now().isoformat(timespec='seconds')
+                logger.info("Cambios detectados: %s", [item.get('name', item.get('id')) for item in relevantes])
+        self._estado['ultima_consulta'] = datetime.now().isoformat(timespec='seconds')
+
+        if self._last_change is not None and time.monotonic() - self._last_change >= self.debounce:
+            # Si falla se deja pendiente y se reintenta en la siguiente consulta
+            self.on_change()
+            self._pending_since = None
+            self._last_change = None
+            self._estado['regeneraciones'] += 1
+            self._estado['ultima_regeneracion'] = datetime.now().isoformat(timespec='seconds')
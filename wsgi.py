@@ -0,0 +1,29 @@
+"""Punto de entrada de producción del servicio Flask (app.py).
+
+Linux, varios procesos con gunicorn (ver gunicorn.conf.py):
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Windows o un solo proceso, con waitress:
+    python wsgi.py
+
+Variables: WEB_HOST, WEB_PORT, WEB_THREADS (y WEB_WORKERS para gunicorn).
+"""
+import logging
+import os
+
+from app import app, warm_up, start_watcher, WATCH_ENABLED
+
+logger = logging.getLogger(__name__)
+
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")
+WEB_PORT = int(os.getenv("WEB_PORT", "8090"))
+WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+
+if __name__ == '__main__':
+    from waitress import serve
+
+    warm_up()
+    if WATCH_ENABLED:
+        start_watcher()
+    logger.info("Sirviendo en http://%s:%s con waitress (%d hilos)", WEB_HOST, WEB_PORT, WEB_THREADS)
+    serve(app, host=WEB_HOST, port=WEB_PORT, threads=WEB_THREADS)